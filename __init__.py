@@ -1,8 +1,12 @@
 # __init__.py
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+import storage
+import metrics
+import passwords
 
 
 # Initialize the database
@@ -10,7 +14,7 @@ db = SQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
     # Create the Flask application
     app = Flask(__name__)
 
@@ -19,28 +23,140 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///yourdatabase.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Storage profile (see storage.PROFILES) plus per-deployment pool and PRAGMA overrides
+    app.config['STORAGE_PROFILE'] = 'sqlite-wal'
+    app.config['STORAGE_POOL'] = {}
+    app.config['STORAGE_PRAGMAS'] = {}
+
+    # Power usage charts: 'client' draws them in the browser from /api/usage/series,
+    # 'server' renders PNGs with matplotlib (settings below)
+    app.config['CHART_RENDERING'] = 'client'
+
+    # Rendered graph cache, bounded by file count and age in seconds. Graphs used within the grace period are
+    # never evicted, so a page's images are still there when the browser fetches them
+    app.config['GRAPH_CACHE_DIR'] = os.path.join(app.instance_path, 'graph_cache')
+    app.config['GRAPH_CACHE_MAX_FILES'] = 500
+    app.config['GRAPH_CACHE_MAX_AGE'] = 7 * 24 * 3600
+    app.config['GRAPH_CACHE_GRACE'] = 600
+
+    # Processes used to render charts in parallel; 0 renders inline in the request
+    app.config['CHART_RENDER_WORKERS'] = min(8, os.cpu_count() or 1)
+
+    # Bulk ingestion: rows per insert batch/commit and how many row errors to report
+    app.config['INGEST_BATCH_SIZE'] = 5000
+    app.config['INGEST_MAX_ERRORS'] = 1000
+
+    # Write-behind for data_entry: readings are queued and group-committed by a background thread.
+    # Batches close at MAX_BATCH readings or MAX_DELAY seconds; history waits up to READ_TIMEOUT
+    # seconds for the user's own queued readings.
+    app.config['WRITE_BEHIND_ENABLED'] = False
+    app.config['WRITE_BEHIND_MAX_BATCH'] = 500
+    app.config['WRITE_BEHIND_MAX_DELAY'] = 0.05
+    app.config['WRITE_BEHIND_QUEUE_SIZE'] = 10000
+    app.config['WRITE_BEHIND_SUBMIT_TIMEOUT'] = 1.0
+    app.config['WRITE_BEHIND_READ_TIMEOUT'] = 2.0
+    app.config['WRITE_BEHIND_SHUTDOWN_TIMEOUT'] = 10.0
+
+    # Cold storage: readings older than ARCHIVE_HORIZON_DAYS are moved by `flask archive-readings`
+    # into per-user column files (memory-mapped when read) under ARCHIVE_DIR
+    app.config['ARCHIVE_DIR'] = os.path.join(app.instance_path, 'archive')
+    app.config['ARCHIVE_HORIZON_DAYS'] = 730
+
+    # History pages: default and largest allowed number of readings per page
+    app.config['HISTORY_PAGE_SIZE'] = 50
+    app.config['HISTORY_MAX_PAGE_SIZE'] = 500
+
+    # History charts: default and largest number of points returned, the downsampling method
+    # ('minmax' keeps every bucket's extremes, 'lttb' follows the shape more closely) and the most
+    # readings decimated directly before falling back to the rollup's daily min/max
+    app.config['HISTORY_CHART_POINTS'] = 500
+    app.config['HISTORY_CHART_MAX_POINTS'] = 2000
+    app.config['HISTORY_CHART_METHOD'] = 'minmax'
+    app.config['HISTORY_CHART_RAW_LIMIT'] = 20000
+
+    # Fleet stats on the admin dashboard: cache lifetime in seconds and trend window in days
+    app.config['STATS_CACHE_TTL'] = 300
+    app.config['STATS_TREND_DAYS'] = 30
+
+    # Calendar months of fleet readings (quantile sketches) that users are compared against
+    app.config['SKETCH_WINDOW_MONTHS'] = 3
+    # Sketch rows per energy type and month that concurrent writers spread over
+    app.config['SKETCH_SHARDS'] = 8
+
+    # Password hashing: werkzeug method and work factor (existing hashes are upgraded at the next login),
+    # worker threads (0 hashes inline), extra requests allowed to wait and how long before answering 503.
+    # Each login blocks its request thread for the hash, so WORKERS + QUEUE must stay below the server's
+    # thread count; by default logins past that are turned away at once instead of holding more threads.
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'
+    app.config['PASSWORD_HASH_WORKERS'] = max(1, (os.cpu_count() or 1) // 2)
+    app.config['PASSWORD_HASH_QUEUE'] = app.config['PASSWORD_HASH_WORKERS']
+    app.config['PASSWORD_HASH_WAIT'] = 0.0
+
+    # Users per page in the admin user directory
+    app.config['ADMIN_USERS_PAGE_SIZE'] = 50
+
+    # user_loader cache: number of user snapshots kept and their lifetime in seconds. A worker drops a snapshot
+    # when it commits a change to that user; other workers keep theirs until the TTL runs out (admin rights
+    # are always re-checked against the database)
+    app.config['USER_CACHE_SIZE'] = 10000
+    app.config['USER_CACHE_TTL'] = 15
+
+    # Request, SQL and render metrics (served at /admin/metrics); requests slower than this many ms are logged
+    app.config['METRICS_ENABLED'] = True
+    app.config['METRICS_SLOW_REQUEST_MS'] = 1000
+
+    # Environment (DATABASE_URL, STORAGE_PROFILE, DB_POOL_*), then explicit overrides, e.g. a scratch database for tooling
+    storage.load_environment(app)
+    if config:
+        app.config.update(config)
+    storage.configure(app)
+
     # Initialize plugins
     db.init_app(app)
-    migrate.init_app(app, db)
+    storage.install(app, db)
+    metrics.install(app, db)
+    import write_behind
+    write_behind.install(app)
+    passwords.install(app)
+    migrate.init_app(app, db, render_as_batch=True)  # Batch mode lets SQLite alter tables
     login_manager.init_app(app)
 
     # Flask-Login configuration
     login_manager.login_view = 'auth.login'
 
-    # User loader callback for Flask-Login
-    from models import User
+    # User loader callback for Flask-Login, served from the per-process user cache
+    import user_cache
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
 
     # Register blueprints
     from auth import auth_bp
     from routes import routes_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(routes_bp)
+    import vendor
+    vendor.check(app)
 
-    # Create the database
-    with app.app_context():
-        db.create_all()
+    # Register CLI commands
+    from query_plans import check_query_plans_command
+    from rollup import rebuild_rollup_command
+    from ingest import ingest_command
+    from export import export_command
+    from recommender import generate_recommendations_command
+    from synthetic import seed_data_command
+    from sketches import rebuild_sketches_command
+    from archive import archive_readings_command
+    from vendor import vendor_chartjs_command
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(rebuild_rollup_command)
+    app.cli.add_command(ingest_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(generate_recommendations_command)
+    app.cli.add_command(seed_data_command)
+    app.cli.add_command(rebuild_sketches_command)
+    app.cli.add_command(archive_readings_command)
+    app.cli.add_command(vendor_chartjs_command)
 
+    # The schema is managed by migrations: run `flask db upgrade` before starting the app
     return app
@@ -0,0 +1,239 @@
+# archive.py
+import functools
+import os
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from urllib.parse import quote
+import click
+from flask import current_app
+from sqlalchemy import func, select, delete
+from models import EnergyUsage, ArchiveChunk
+from __init__ import db
+import pagination
+import lazy
+import fileio
+
+COLUMNS = ['id', 'user_id', 'meter_number', 'energy_type', 'units_used', 'date_recorded']
+STORED_COLUMNS = ['id', 'date_recorded', 'units_used', 'meter_number']  # One .npy file each per chunk
+DELETE_BATCH = 900  # Ids per DELETE, under SQLite's bound-parameter limit
+CHUNK_CACHE_SIZE = 64  # Memory-mapped chunks kept open per process
+
+# An archived reading; same fields and order as export.COLUMNS, so it serializes like a hot row
+Reading = namedtuple('Reading', COLUMNS)
+
+
+def chunk_prefix(user_id, energy_type, year):
+    # Chunk files are per user, energy type and calendar year: '<dir>/<user>/<type>-<year>-'
+    return os.path.join(current_app.config['ARCHIVE_DIR'], str(user_id), f'{quote(energy_type, safe="")}-{year}-')
+
+
+def chunk_paths(user_id, energy_type, year, count):
+    # The column files of one generation of a chunk. Every archive run into a chunk writes a new
+    # generation, named by its reading count; ArchiveChunk.reading_count names the committed one,
+    # so a run that never committed leaves files no reader opens.
+    prefix = chunk_prefix(user_id, energy_type, year)
+    return {name: f'{prefix}{count}.{name}.npy' for name in STORED_COLUMNS}
+
+
+@functools.lru_cache(maxsize=CHUNK_CACHE_SIZE)
+def _load(paths, mtime_ns):
+    # A chunk's columns, sorted by (date_recorded, id) when written, as read-only memory maps: a
+    # request only pages in the rows it slices, and nothing is decompressed or copied up front
+    np = lazy.numpy()
+    return {name: np.load(path, mmap_mode='r') for name, path in paths}
+
+
+def _read(chunk):
+    paths = chunk_paths(chunk.user_id, chunk.energy_type, chunk.year, chunk.reading_count)
+    return _load(tuple(paths.items()), os.stat(paths['id']).st_mtime_ns)
+
+
+def _chunks(user_ids=None, energy_types=None, start=None, end=None):
+    # Catalogue entries that may hold readings in [start, end)
+    query = ArchiveChunk.query.filter(ArchiveChunk.reading_count > 0)
+    if user_ids:
+        query = query.filter(ArchiveChunk.user_id.in_(user_ids))
+    if energy_types:
+        query = query.filter(ArchiveChunk.energy_type.in_(energy_types))
+    if start is not None:
+        query = query.filter(ArchiveChunk.year >= start.year)
+    if end is not None:
+        query = query.filter(ArchiveChunk.year <= (end - timedelta(microseconds=1)).year)
+    return query.order_by(ArchiveChunk.user_id, ArchiveChunk.energy_type, ArchiveChunk.year).all()
+
+
+def _select(columns, start=None, end=None):
+    # Rows recorded in [start, end); chunks are sorted by date, so this is a slice (a view of the map)
+    np = lazy.numpy()
+    dates = columns['date_recorded']
+    first = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, 'us'), side='left'))
+    last = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(end, 'us'), side='left'))
+    return {name: values[first:max(first, last)] for name, values in columns.items()}
+
+
+def _readings(user_id, energy_type, columns):
+    units = [None if value != value else value for value in columns['units_used'].tolist()]  # NaN -> NULL
+    return [Reading(record_id, user_id, meter_number.decode() or None, energy_type, units_used, date_recorded)
+            for record_id, meter_number, units_used, date_recorded in zip(
+                columns['id'].tolist(), columns['meter_number'].tolist(), units,
+                columns['date_recorded'].astype('M8[us]').tolist())]
+
+
+def readings(user_id, energy_type, start=None, end=None):
+    # A user's archived readings of one energy type in [start, end) as column arrays sorted by
+    # (date_recorded, id), or None when nothing is archived there
+    chunks = _chunks([user_id], [energy_type], start, end)
+    if not chunks:
+        return None
+    np = lazy.numpy()
+    parts = [_select(_read(chunk), start, end) for chunk in chunks]  # Years are disjoint and in order
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def iter_rows(user_ids=None, energy_types=None, start=None, end=None):
+    # Archived readings as Reading tuples, per user, energy type and year
+    for chunk in _chunks(user_ids, energy_types, start, end):
+        yield from _readings(chunk.user_id, chunk.energy_type, _select(_read(chunk), start, end))
+
+
+def _cold_page(columns, page_size, after=None, before=None):
+    # The archived half of a keyset page, newest first, and whether more rows lie beyond it
+    np = lazy.numpy()
+    dates, ids = columns['date_recorded'], columns['id']
+    if before is not None:
+        position = _position(dates, ids, np.datetime64(before[0], 'us'), before[1], 'right')
+        selected = slice(position, position + page_size)
+        more = len(ids) - position > page_size
+    else:
+        position = len(ids)
+        if after is not None:
+            position = _position(dates, ids, np.datetime64(after[0], 'us'), after[1], 'left')
+        selected = slice(max(position - page_size, 0), position)
+        more = position > page_size
+    return {name: values[selected][::-1] for name, values in columns.items()}, more
+
+
+def _position(dates, ids, cursor_date, cursor_id, side):
+    # Insertion point of a (date, id) cursor in arrays sorted by (date, id)
+    np = lazy.numpy()
+    first = int(np.searchsorted(dates, cursor_date, side='left'))
+    last = int(np.searchsorted(dates, cursor_date, side='right'))
+    return first + int(np.searchsorted(ids[first:last], cursor_id, side=side))
+
+
+def keyset_page(query, user_id, energy_type, start, end, page_size, after=None, before=None):
+    # pagination.keyset_page over the hot rows in query and the user's archived readings together
+    rows, next_cursor, prev_cursor = pagination.keyset_page(query, EnergyUsage.date_recorded, EnergyUsage.id,
+                                                            page_size, after=after, before=before)
+    cold = readings(user_id, energy_type, start, end)
+    if cold is None:
+        return rows, next_cursor, prev_cursor
+
+    cold, cold_more = _cold_page(cold, page_size, after, before)
+    rows = sorted(list(rows) + _readings(user_id, energy_type, cold),
+                  key=lambda row: (row.date_recorded, row.id), reverse=True)
+    if before is not None:
+        has_newer = prev_cursor is not None or cold_more or len(rows) > page_size
+        has_older = True
+        rows = rows[-page_size:]
+    else:
+        has_older = next_cursor is not None or cold_more or len(rows) > page_size
+        has_newer = after is not None
+        rows = rows[:page_size]
+    if not rows:
+        return rows, None, None
+    next_cursor = pagination.encode_cursor(rows[-1].date_recorded, rows[-1].id) if has_older else None
+    prev_cursor = pagination.encode_cursor(rows[0].date_recorded, rows[0].id) if has_newer else None
+    return rows, next_cursor, prev_cursor
+
+
+def _write_chunk(user_id, energy_type, year, count, columns):
+    # Write a new generation of the chunk. Generations other than the committed one (`count` before
+    # this run) are removed first: the one this replaces stays until the next run, for readers that
+    # still have it open, and files of runs that never committed are dropped.
+    prefix = chunk_prefix(user_id, energy_type, year)
+    committed = set(chunk_paths(user_id, energy_type, year, count).values())
+    directory = os.path.dirname(prefix)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if path.startswith(prefix) and path.endswith('.npy') and path not in committed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    np = lazy.numpy()
+    new_count = len(columns['id'])
+    for name, path in chunk_paths(user_id, energy_type, year, new_count).items():
+        fileio.write_atomic(path, lambda f: np.save(f, columns[name]))
+
+
+def archive(before, user_ids=None):
+    # Move readings recorded before `before` from EnergyUsage into the chunk files, committing once per
+    # (user, energy type). The daily rollup and sketches keep counting them. Run from one process at a time.
+    np = lazy.numpy()
+    # SQLite hands out max(id) + 1, so the newest row always stays hot to keep ids unique across tiers
+    newest = db.session.query(func.max(EnergyUsage.id)).scalar()
+    pairs = db.session.query(EnergyUsage.user_id, EnergyUsage.energy_type).filter(
+        EnergyUsage.date_recorded < before,
+        EnergyUsage.user_id.is_not(None),
+        EnergyUsage.energy_type.is_not(None)
+    )
+    if user_ids:
+        pairs = pairs.filter(EnergyUsage.user_id.in_(user_ids))
+    pairs = pairs.distinct().order_by(EnergyUsage.user_id, EnergyUsage.energy_type).all()
+
+    moved = 0
+    for user_id, energy_type in pairs:
+        rows = db.session.execute(select(EnergyUsage.id, EnergyUsage.meter_number, EnergyUsage.units_used,
+                                         EnergyUsage.date_recorded).where(
+            EnergyUsage.user_id == user_id,
+            EnergyUsage.energy_type == energy_type,
+            EnergyUsage.date_recorded < before,
+            EnergyUsage.id != newest
+        ).order_by(EnergyUsage.date_recorded, EnergyUsage.id)).all()
+        if not rows:
+            continue
+
+        years = {}
+        for row in rows:
+            years.setdefault(row.date_recorded.year, []).append(row)
+        for year, year_rows in years.items():
+            chunk = db.session.get(ArchiveChunk, (user_id, energy_type, year))
+            if chunk is None:
+                chunk = ArchiveChunk(user_id=user_id, energy_type=energy_type, year=year, reading_count=0)
+                db.session.add(chunk)
+            new = {'id': np.array([row.id for row in year_rows], dtype=np.int64),
+                   'date_recorded': np.array([row.date_recorded for row in year_rows], dtype='M8[us]'),
+                   'units_used': np.array([np.nan if row.units_used is None else row.units_used for row in year_rows],
+                                          dtype=np.float64),
+                   # Fixed-width UTF-8 bytes, so the column can be memory-mapped like the others
+                   'meter_number': np.array([(row.meter_number or '').encode() for row in year_rows], dtype=bytes)}
+            if chunk.reading_count:
+                # Late back-dated readings can sort before archived ones, so the merged chunk is re-sorted
+                old = _read(chunk)
+                new = {name: np.concatenate([old[name], values]) for name, values in new.items()}
+                order = np.lexsort((new['id'], new['date_recorded']))
+                new = {name: values[order] for name, values in new.items()}
+            _write_chunk(user_id, energy_type, year, chunk.reading_count, new)
+            chunk.reading_count += len(year_rows)
+
+        ids = [row.id for row in rows]
+        for first in range(0, len(ids), DELETE_BATCH):
+            db.session.execute(delete(EnergyUsage).where(EnergyUsage.id.in_(ids[first:first + DELETE_BATCH])))
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+@click.command('archive-readings')
+@click.option('--horizon-days', type=int, default=None,
+              help='Archive readings older than this many days (default: ARCHIVE_HORIZON_DAYS).')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only archive these users (repeatable).')
+def archive_readings_command(horizon_days, user_ids):
+    """Move old readings out of the EnergyUsage table into compressed per-user archive files."""
+    horizon_days = current_app.config['ARCHIVE_HORIZON_DAYS'] if horizon_days is None else horizon_days
+    before = datetime.combine(date.today() - timedelta(days=horizon_days), time.min)
+    moved = archive(before, list(user_ids))
+    click.echo(f'Archived {moved} readings recorded before {before.date()}.')
@@ -1,9 +1,10 @@
 # auth.py
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, current_user, login_required
-from werkzeug.security import check_password_hash, generate_password_hash
 from models import User
 from __init__ import db
+import user_cache
+import passwords
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -17,6 +18,13 @@ def login():
         password = request.form.get('password')
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
+            # Upgrade hashes made with an older PASSWORD_HASH_METHOD while the plain password is at hand
+            if passwords.needs_rehash(user.password_hash):
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except passwords.HasherBusy:
+                    pass  # Try again at a quieter login
             login_user(user)
             # Redirect to the dashboard based on whether the user is an admin or not
             return redirect(url_for('routes.admin_dashboard')) if user.is_admin else redirect(url_for('routes.user_dashboard'))
@@ -61,6 +69,7 @@ def user_signup():
         # Add new user to the database
         db.session.add(new_user)
         db.session.commit()
+        user_cache.invalidate(new_user.id)
 
         flash('Account created successfully!')
         return redirect(url_for('auth.login'))
@@ -100,6 +109,7 @@ def admin_signup():
         # Add new user to the database
         db.session.add(new_user)
         db.session.commit()
+        user_cache.invalidate(new_user.id)
 
         flash('Account created successfully!')
         return redirect(url_for('auth.login'))
@@ -0,0 +1,137 @@
+# benchmarks/auth.py
+#
+# Login throughput benchmark: login threads post /auth/login as fast as they can while
+# dashboard threads keep loading /users/dashboard, for each password hash method and
+# hashing pool size. Reports sustained logins per second, rejected (503) logins and
+# the latency of both. With --seed-method the accounts start with another hash, so
+# the run also shows the cost of upgrading them at login.
+#
+#   python benchmarks/auth.py --methods scrypt:32768:8:1 pbkdf2:sha256:600000 --workers 0 2 --seconds 10
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)] * 1000, 3)
+
+
+def run(method, workers, args, workdir):
+    from __init__ import create_app, db
+    from models import User
+    import passwords
+    import synthetic
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'auth_{len(os.listdir(workdir))}.db'),
+        'GRAPH_CACHE_DIR': os.path.join(workdir, 'graph_cache'),
+        'PASSWORD_HASH_METHOD': args.seed_method or method,
+        'PASSWORD_HASH_WORKERS': workers,
+        'PASSWORD_HASH_QUEUE': max(workers, 1) if args.queue is None else args.queue,
+        'PASSWORD_HASH_WAIT': args.wait,
+        'METRICS_SLOW_REQUEST_MS': None,
+    })
+    with app.app_context():
+        db.create_all()
+        synthetic.generate(users=args.users, years=0.1, admins=0, recommendation_days=0)
+        app.config['PASSWORD_HASH_METHOD'] = method
+        emails = [email for email, in db.session.query(User.email)]
+
+    deadline = time.monotonic() + args.seconds
+    results = {'login': [], 'dashboard': []}
+    rejected = {'login': 0, 'dashboard': 0}
+    lock = threading.Lock()
+
+    def login(_client):
+        # A fresh session per login, as every login in a spike comes from a new browser
+        response = app.test_client().post('/auth/login', data={'email': random.choice(emails), 'password': 'password'})
+        return response.status_code
+
+    def dashboard(client):
+        response = client.get('/users/dashboard')
+        response.close()
+        return response.status_code
+
+    def worker(kind, operation):
+        client = app.test_client()
+        if kind == 'dashboard':
+            client.post('/auth/login', data={'email': emails[0], 'password': 'password'})
+        latencies = []
+        busy = 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            status = operation(client)
+            if status == 503:
+                busy += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+        with lock:
+            results[kind].extend(latencies)
+            rejected[kind] += busy
+
+    threads = [threading.Thread(target=worker, args=('login', login)) for _ in range(args.logins)] + \
+              [threading.Thread(target=worker, args=('dashboard', dashboard)) for _ in range(args.dashboards)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        upgraded = sum(1 for password_hash, in db.session.query(User.password_hash)
+                       if not passwords.needs_rehash(password_hash))
+        db.engine.dispose()
+
+    return {
+        'method': method,
+        'seed_method': args.seed_method or method,
+        'hash_workers': workers,
+        'accounts_on_method': upgraded,
+        **{f'{kind}s': {
+            'ops': len(results[kind]),
+            'ops_per_second': round(len(results[kind]) / args.seconds, 1),
+            'rejected': rejected[kind],
+            'p50_ms': percentile(results[kind], 0.50),
+            'p95_ms': percentile(results[kind], 0.95),
+            'max_ms': percentile(results[kind], 1.0),
+        } for kind in ('login', 'dashboard')},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--methods', nargs='+', default=['scrypt:32768:8:1'], help='werkzeug hash methods to compare')
+    parser.add_argument('--workers', nargs='+', type=int, default=[0, max(1, (os.cpu_count() or 1) // 2)],
+                        help='PASSWORD_HASH_WORKERS values to compare (0 hashes inline)')
+    parser.add_argument('--seed-method', default=None, help='Hash method the accounts start with (default: the run method)')
+    parser.add_argument('--logins', type=int, default=8, help='Threads posting logins')
+    parser.add_argument('--dashboards', type=int, default=4, help='Threads loading the dashboard')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--queue', type=int, default=None, help='PASSWORD_HASH_QUEUE (default: one per hash worker)')
+    parser.add_argument('--wait', type=float, default=0.0, help='PASSWORD_HASH_WAIT')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='auth_bench_')
+    try:
+        report = [run(method, workers, args, workdir) for method in args.methods for workers in args.workers]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({'logins': args.logins, 'dashboards': args.dashboards, 'seconds': args.seconds,
+                      'cpus': os.cpu_count(), 'runs': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
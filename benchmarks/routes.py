@@ -0,0 +1,172 @@
+# benchmarks/routes.py
+#
+# Route-level benchmark: seeds a scratch database per data size with synthetic.generate,
+# then times every page through the Flask test client. Reports p50/p95 latency, SQL
+# queries per request and peak Python memory per request as JSON.
+#
+#   python benchmarks/routes.py --sizes 10x1 100x1 1000x2 --iterations 20 --output bench.json
+#
+# A size is USERSxYEARS; readings per day and energy types apply to every size.
+import argparse
+from datetime import date
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+TIME_PERIODS = ['7 days', '30 days', '3 months', '6 months']
+AGGREGATIONS = ['all', 'aggregate']
+
+USER_ROUTES = [('user_dashboard', '/users/dashboard')] + \
+    [(f'history[{period}, {aggregate}]', f'/users/history?time_period={period}&aggregate={aggregate}')
+     for period in TIME_PERIODS for aggregate in AGGREGATIONS] + \
+    [('power_usage', '/users/power_usage'),
+     ('recommendations', '/users/recommendations')] + \
+    [(f'usage_series[{interval}]', f'/api/usage/series?interval={interval}')
+     for interval in ('daily', 'weekly', 'monthly')] + \
+    [(f'usage_history[{method}, {years}y]', f'/api/usage/history?method={method}&start={date.today().year - years}-01-01')
+     for method in ('minmax', 'lttb') for years in (1, 5)]
+ADMIN_ROUTES = [('admin_dashboard', '/admin/dashboard'),
+                ('admin_users', '/admin/users'),
+                ('admin_users[sorted]', '/admin/users?sort=total_electricity&order=desc')] + \
+    [(f'history_user[{period}, {aggregate}]', f'/Admin/history/{{user_id}}?time_period={period}&aggregate={aggregate}')
+     for period in TIME_PERIODS for aggregate in AGGREGATIONS]
+
+
+def parse_size(value):
+    users, _, years = value.lower().partition('x')
+    return int(users), float(years or 1)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(client, engine, route, iterations):
+    queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        queries[-1] += 1
+
+    def request():
+        queries.append(0)
+        started = time.perf_counter()
+        response = client.get(route)
+        response.get_data()  # Drain streamed templates
+        elapsed = time.perf_counter() - started
+        response.close()
+        return response.status_code, elapsed
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        # The first request fills caches (stats, graphs, user snapshots); report it separately
+        status, cold = request()
+        timings = [request()[1] for _ in range(iterations)]
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    return {
+        'status': status,
+        'cold_ms': round(cold * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'queries_cold': queries[0],
+        'queries': queries[1],
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_size(users, years, args, workdir):
+    from __init__ import create_app, db
+    from models import User
+    import stats_cache
+    import synthetic
+    import user_cache
+
+    name = f'{users}x{years:g}'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'{name}.db'),
+        'STORAGE_PROFILE': args.profile,
+        'GRAPH_CACHE_DIR': os.path.join(workdir, f'graph_cache_{name}'),
+        'CHART_RENDER_WORKERS': args.chart_workers,
+    })
+    # Module-level caches outlive the previous size's app
+    stats_cache.invalidate()
+    user_cache.invalidate()
+
+    with app.app_context():
+        db.create_all()
+        seeded = synthetic.generate(users, years, args.readings_per_day, args.energy_types, args.seed, admins=1)
+        user_id = db.session.query(User.id).filter(User.email == f'user0@{synthetic.EMAIL_DOMAIN}').scalar()
+        engine = db.engine
+
+    # Requests run outside an app context so each gets its own g and login state
+    routes = {}
+    client = app.test_client()
+    client.post('/auth/login', data={'email': f'user0@{synthetic.EMAIL_DOMAIN}', 'password': 'password'})
+    for label, route in USER_ROUTES:
+        routes[label] = measure(client, engine, route, args.iterations)
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': f'admin0@{synthetic.EMAIL_DOMAIN}', 'password': 'password'})
+    for label, route in ADMIN_ROUTES:
+        routes[label] = measure(client, engine, route.format(user_id=user_id), args.iterations)
+
+    engine.dispose()
+    return {'size': name, 'seeded': seeded, 'routes': routes}
+
+
+def main():
+    import synthetic
+
+    parser = argparse.ArgumentParser(description='Time every page at several data sizes.')
+    parser.add_argument('--sizes', nargs='+', default=['10x1', '100x1'], help='USERSxYEARS, e.g. 1000x2')
+    parser.add_argument('--readings-per-day', type=int, default=1)
+    parser.add_argument('--energy-types', nargs='+', default=None, choices=synthetic.ENERGY_TYPES)
+    parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', default='sqlite-wal', help='Storage profile (see storage.PROFILES)')
+    parser.add_argument('--chart-workers', type=int, default=0, help='0 renders charts in-process')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='route_bench_')
+    try:
+        sizes = [run_size(*parse_size(size), args, workdir) for size in args.sizes]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'readings_per_day': args.readings_per_day,
+        'profile': args.profile,
+        'sizes': sizes,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/startup.py
+#
+# Worker start-up benchmark. Each run is a fresh interpreter that imports app.py (which
+# calls create_app), serves one request and then renders one chart, so the cost of
+# lazily imported numpy/matplotlib shows up on first use instead of at boot.
+#
+#   python benchmarks/startup.py --runs 10 --output startup.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+booted = time.perf_counter()
+heavy = sorted(name for name in ('numpy', 'matplotlib', 'matplotlib.pyplot') if name in sys.modules)
+response = app.app.test_client().get('/')
+response.close()
+first_request = time.perf_counter()
+import charts
+charts.render_png('bar', 'Startup', ['a', 'b'], [1, 2])
+first_chart = time.perf_counter()
+print(json.dumps({'create_app': booted - started, 'first_request': first_request - booted,
+                  'first_chart': first_chart - first_request, 'loaded_at_boot': heavy}))
+'''
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min_ms': round(values[0] * 1000, 1),
+        'p50_ms': round(statistics.median(values) * 1000, 1),
+        'p95_ms': round(values[min(int(len(values) * 0.95), len(values) - 1)] * 1000, 1),
+        'max_ms': round(values[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time cold worker start-up in fresh interpreters.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup_bench_')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'startup.db'),
+               PYTHONPATH=ROOT)
+    samples = []
+    try:
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            sample = json.loads(output.strip().splitlines()[-1])
+            sample['process'] = time.perf_counter() - started
+            samples.append(sample)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'loaded_at_boot': samples[0]['loaded_at_boot'],
+        **{phase: summarize([sample[phase] for sample in samples])
+           for phase in ('process', 'create_app', 'first_request', 'first_chart')},
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
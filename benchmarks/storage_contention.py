@@ -0,0 +1,173 @@
+# benchmarks/storage_contention.py
+#
+# Multi-threaded read/write contention benchmark for the storage profiles.
+# Writers do what data_entry does (insert a reading, update the rollup, commit);
+# readers do what the dashboard and history pages do. Each profile runs against
+# its own scratch SQLite file. With --write-behind, writers hand readings to the
+# write-behind queue instead (write latency is then the time to enqueue).
+#
+#   python benchmarks/storage_contention.py --writers 4 --readers 16 --seconds 10
+import argparse
+import json
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)] * 1000, 3)
+
+
+def seed(db, users, readings_per_user):
+    from models import User, EnergyUsage
+    import rollup
+
+    db.session.execute(insert(User), [
+        {'firstname': 'Bench', 'lastname': str(i), 'email': f'bench{i}@example.com', 'password_hash': '-', 'is_admin': False}
+        for i in range(users)])
+    user_ids = [row[0] for row in db.session.query(User.id)]
+    now = datetime.now()
+    rows = [{'user_id': user_id, 'energy_type': random.choice(['electricity', 'water']),
+             'units_used': random.uniform(1, 50), 'date_recorded': now - timedelta(hours=random.randint(0, 24 * 180))}
+            for user_id in user_ids for _ in range(readings_per_user)]
+    db.session.execute(insert(EnergyUsage), rows)
+    rollup.rebuild()
+    db.session.commit()
+    return user_ids
+
+
+def run_profile(profile, args, workdir):
+    from __init__ import create_app, db
+    from models import EnergyUsage
+    import pagination
+    import rollup
+    import storage
+    import write_behind
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'{profile}.db'),
+        'STORAGE_PROFILE': profile,
+        'GRAPH_CACHE_DIR': os.path.join(workdir, 'graph_cache'),
+        'WRITE_BEHIND_ENABLED': args.write_behind,
+    })
+    with app.app_context():
+        db.create_all()
+        user_ids = seed(db, args.users, args.readings)
+        settings = storage.describe(db.engine)
+
+    deadline = time.monotonic() + args.seconds
+    results = {'write': [], 'read': []}
+    errors = {'write': 0, 'read': 0}
+    lock = threading.Lock()
+
+    def write_once():
+        user_id = random.choice(user_ids)
+        if args.write_behind:
+            write_behind.submit({'user_id': user_id, 'energy_type': 'electricity',
+                                 'units_used': random.uniform(1, 50), 'date_recorded': datetime.now()})
+            return
+        usage = EnergyUsage(user_id=user_id, energy_type='electricity', units_used=random.uniform(1, 50),
+                            date_recorded=datetime.now())
+        db.session.add(usage)
+        rollup.add_readings([(user_id, usage.energy_type, usage.date_recorded, usage.units_used)])
+        db.session.commit()
+
+    def read_once():
+        user_id = random.choice(user_ids)
+        rollup.average(user_id, 'electricity')
+        rollup.average(user_id, 'water')
+        query = EnergyUsage.query.filter(EnergyUsage.user_id == user_id, EnergyUsage.energy_type == 'electricity',
+                                         EnergyUsage.date_recorded >= datetime.now() - timedelta(days=30))
+        pagination.keyset_page(query, EnergyUsage.date_recorded, EnergyUsage.id, 50)
+
+    def worker(kind, operation):
+        latencies = []
+        failures = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    operation()
+                    latencies.append(time.perf_counter() - started)
+                except (OperationalError, queue.Full):
+                    # "database is locked" and friends, or a write-behind queue that is full
+                    db.session.rollback()
+                    failures += 1
+                db.session.remove()
+        with lock:
+            results[kind].extend(latencies)
+            errors[kind] += failures
+
+    threads = [threading.Thread(target=worker, args=('write', write_once)) for _ in range(args.writers)] + \
+              [threading.Thread(target=worker, args=('read', read_once)) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    drained = time.perf_counter()
+    if args.write_behind:
+        app.extensions['write_behind'].close()
+    drain_seconds = time.perf_counter() - drained
+
+    with app.app_context():
+        stored = db.session.query(EnergyUsage).count() - args.users * args.readings
+        db.engine.dispose()
+
+    return {
+        'profile': profile,
+        'settings': settings,
+        'write_behind': args.write_behind,
+        'readings_stored': stored,
+        'drain_seconds': round(drain_seconds, 3),
+        **{f'{kind}s': {
+            'ops': len(results[kind]),
+            'ops_per_second': round(len(results[kind]) / args.seconds, 1),
+            'errors': errors[kind],
+            'p50_ms': percentile(results[kind], 0.50),
+            'p95_ms': percentile(results[kind], 0.95),
+            'max_ms': percentile(results[kind], 1.0),
+        } for kind in ('write', 'read')},
+    }
+
+
+def main():
+    import storage
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--profiles', nargs='+', default=list(storage.PROFILES), choices=list(storage.PROFILES))
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=200, help='Seed readings per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--write-behind', action='store_true', help='Queue writes for group commit')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='storage_bench_')
+    try:
+        report = [run_profile(profile, args, workdir) for profile in args.profiles]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({'writers': args.writers, 'readers': args.readers, 'seconds': args.seconds,
+                      'profiles': report}, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
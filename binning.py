@@ -0,0 +1,58 @@
+# binning.py
+from datetime import date, datetime, timedelta
+from models import DailyUsage
+from __init__ import db
+import rollup
+import lazy
+
+
+def day_range(start_day, end_day):
+    # Every calendar day from start_day to end_day inclusive
+    return [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+
+
+def _as_date(value):
+    # Normalize 'YYYY-MM-DD' text and datetimes to a date
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def daily_usage(user_id, start_day, end_day, energy_types):
+    # One query against the daily rollup for all energy types; returns energy_type -> array of
+    # daily totals (index 0 is start_day). Types without any readings in the range are left out.
+    rows = db.session.query(DailyUsage.energy_type, DailyUsage.day, DailyUsage.units_total).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.energy_type.in_(energy_types),
+        DailyUsage.day >= start_day,
+        DailyUsage.day <= end_day
+    ).all()
+
+    if not rows:
+        return {}
+
+    np = lazy.numpy()
+    types = np.array([row[0] for row in rows])
+    offsets = np.array([(_as_date(row[1]) - start_day).days for row in rows])
+    totals = np.array([row[2] or 0.0 for row in rows], dtype=float)
+
+    num_days = (end_day - start_day).days + 1
+    series = {}
+    for energy_type in np.unique(types):
+        mask = types == energy_type
+        values = np.zeros(num_days)
+        np.add.at(values, offsets[mask], totals[mask])
+        series[str(energy_type)] = values
+    return series
+
+
+def weekly_totals(daily, weeks):
+    # Sum the trailing weeks * 7 days of a daily series into consecutive 7-day buckets
+    return daily[-weeks * 7:].reshape(weeks, 7).sum(axis=1)
+
+
+def usage_totals(user_id, energy_type, start_date, end_date=None):
+    # Total and number of readings from the day of start_date onwards (to end_date inclusive), read from the rollup
+    return rollup.totals(user_id, energy_type, _as_date(start_date), _as_date(end_date))
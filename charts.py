@@ -0,0 +1,68 @@
+# charts.py
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_png(kind, title, labels, values):
+    # Object-oriented Figure API: no pyplot global state, safe to run in any process.
+    # matplotlib is imported here, on the first render, so importing charts stays cheap
+    # for workers, CLI commands and migrations that never draw a graph.
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    if kind == 'bar':
+        ax.bar(labels, values)
+    else:
+        ax.plot(labels, values, marker='o')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Energy Usage')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=45)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers start from a clean forkserver (spawn where there is none), never by forking a
+            # request thread: a forked copy of a threaded server can inherit locks held mid-request
+            # (logging, the SQLAlchemy pool) and hang
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_many(jobs, workers):
+    # jobs maps a key to (kind, title, labels, values); returns key -> PNG bytes.
+    # With workers == 0 everything is rendered inline in the calling thread.
+    if not jobs:
+        return {}
+    if workers <= 0:
+        return {key: render_png(*args) for key, args in jobs.items()}
+
+    try:
+        pool = _get_pool(workers)
+        futures = {key: pool.submit(render_png, *args) for key, args in jobs.items()}
+        return {key: future.result() for key, future in futures.items()}
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM killed); start a fresh pool next time and render inline now
+        _reset_pool()
+        return {key: render_png(*args) for key, args in jobs.items()}
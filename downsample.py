@@ -0,0 +1,117 @@
+# downsample.py
+from datetime import datetime, time, timedelta
+from flask import current_app
+from models import EnergyUsage, DailyUsage
+from __init__ import db
+import rollup
+import archive
+import lazy
+
+METHODS = ('minmax', 'lttb')
+
+
+def lttb(x, y, points):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, per bucket, the point forming
+    # the largest triangle with the previous pick and the next bucket's average. Only the bucket loop is
+    # in Python; the work per point is vectorized. Returns sorted indices, at most `points` (and at least 3).
+    np = lazy.numpy()
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    points = max(points, 3)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)  # points - 2 buckets between the end points
+    sizes = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1])[1:] / sizes[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1])[1:] / sizes[1:], y[-1])
+
+    selected = np.empty(points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        first, last = edges[bucket], edges[bucket + 1]
+        area = np.abs((x[previous] - next_x[bucket]) * (y[first:last] - y[previous]) -
+                      (x[previous] - x[first:last]) * (next_y[bucket] - y[previous]))
+        previous = first + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def min_max(x, y, points):
+    # Keeps the smallest and largest value of every bucket (plus the end points), so no peak or dip is lost.
+    # Returns sorted indices, at most `points` (and at least 4) of them.
+    np = lazy.numpy()
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    points = max(points, 4)
+    buckets = (points - 2) // 2
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    lows = np.minimum.reduceat(y, edges[:-1])[bucket] == y
+    highs = np.maximum.reduceat(y, edges[:-1])[bucket] == y
+    # First index of each bucket's minimum and maximum
+    low_index = np.flatnonzero(lows)[np.unique(bucket[lows], return_index=True)[1]]
+    high_index = np.flatnonzero(highs)[np.unique(bucket[highs], return_index=True)[1]]
+    return np.unique(np.concatenate(([0, n - 1], low_index, high_index)))
+
+
+def _readings(user_id, energy_type, start, end):
+    start, end = datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
+    rows = db.session.query(EnergyUsage.date_recorded, EnergyUsage.units_used).filter(
+        EnergyUsage.user_id == user_id,
+        EnergyUsage.energy_type == energy_type,
+        EnergyUsage.date_recorded >= start,
+        EnergyUsage.date_recorded < end,
+        EnergyUsage.units_used.is_not(None)
+    ).order_by(EnergyUsage.date_recorded, EnergyUsage.id).all()
+    cold = archive.readings(user_id, energy_type, start, end)
+    if cold is not None:
+        # Archived readings are older than the hot ones except for late back-dated entries, so sort the union
+        rows = sorted(rows + [(recorded, units_used) for recorded, units_used in zip(
+            cold['date_recorded'].astype('M8[us]').tolist(), cold['units_used'].tolist()) if units_used == units_used],
+            key=lambda row: row[0])
+    return [(recorded.isoformat(), recorded.timestamp(), units_used) for recorded, units_used in rows]
+
+
+def _daily_envelope(user_id, energy_type, start, end):
+    # Each day's smallest and largest reading from the rollup, so the extremes survive without touching raw rows
+    rows = db.session.query(DailyUsage.day, DailyUsage.units_min, DailyUsage.units_max).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.energy_type == energy_type,
+        DailyUsage.day >= start,
+        DailyUsage.day <= end,
+        DailyUsage.units_min.is_not(None)
+    ).order_by(DailyUsage.day).all()
+    points = []
+    for day, units_min, units_max in rows:
+        timestamp = datetime.combine(day, time.min).timestamp()
+        points.append((day.isoformat(), timestamp, units_min))
+        if units_max != units_min:
+            points.append((day.isoformat(), timestamp + 43200, units_max))
+    return points
+
+
+def usage_points(user_id, energy_type, start, end, points, method='minmax'):
+    # A user's readings between start and end (dates, inclusive) as at most `points` (time, units) pairs.
+    # Ranges with up to HISTORY_CHART_RAW_LIMIT readings are decimated from the readings themselves,
+    # longer ones from the rollup's daily min/max, so the cost and payload do not grow with the span.
+    np = lazy.numpy()
+    _, readings = rollup.totals(user_id, energy_type, start, end)
+    if readings <= current_app.config['HISTORY_CHART_RAW_LIMIT']:
+        resolution = 'reading'
+        source = _readings(user_id, energy_type, start, end)
+    else:
+        resolution = 'day'
+        source = _daily_envelope(user_id, energy_type, start, end)
+
+    if len(source) > points:
+        x = np.array([row[1] for row in source])
+        y = np.array([row[2] for row in source], dtype=float)
+        keep = (lttb if method == 'lttb' else min_max)(x, y, points)
+        source = [source[index] for index in keep.tolist()]
+    else:
+        method = None
+
+    return {'user_id': user_id, 'energy_type': energy_type, 'start': start.isoformat(), 'end': end.isoformat(),
+            'resolution': resolution, 'method': method, 'readings': readings,
+            'points': [[label, units] for label, _, units in source]}
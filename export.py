@@ -0,0 +1,129 @@
+# export.py
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select
+from models import EnergyUsage
+from __init__ import db
+import archive
+
+COLUMNS = ['id', 'user_id', 'meter_number', 'energy_type', 'units_used', 'date_recorded']
+CHUNK_SIZE = 64 * 1024  # Characters buffered before a chunk is yielded
+YIELD_PER = 2000  # Rows fetched from the cursor at a time
+
+
+def parse_day(value, end=False):
+    # 'YYYY-MM-DD' -> datetime; an end day is exclusive midnight of the following day
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d')
+    return day + timedelta(days=1) if end else day
+
+
+def export_query(user_ids=None, energy_types=None, start=None, end=None):
+    query = select(*(getattr(EnergyUsage, column) for column in COLUMNS))
+    if user_ids:
+        query = query.where(EnergyUsage.user_id.in_(user_ids))
+    if energy_types:
+        query = query.where(EnergyUsage.energy_type.in_(energy_types))
+    if start is not None:
+        query = query.where(EnergyUsage.date_recorded >= start)
+    if end is not None:
+        query = query.where(EnergyUsage.date_recorded < end)
+
+    # Follow an index so the database never has to sort the whole result
+    if user_ids:
+        return query.order_by(EnergyUsage.user_id, EnergyUsage.energy_type, EnergyUsage.date_recorded, EnergyUsage.id)
+    return query.order_by(EnergyUsage.id)
+
+
+def iter_rows(query):
+    # Server-side cursor where the backend supports it, fetched YIELD_PER rows at a time
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=YIELD_PER))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def iter_readings(user_ids=None, energy_types=None, start=None, end=None):
+    # Archived readings first, then the EnergyUsage table
+    yield from archive.iter_rows(user_ids, energy_types, start, end)
+    yield from iter_rows(export_query(user_ids, energy_types, start, end))
+
+
+def _values(row):
+    values = list(row)
+    if values[-1] is not None:
+        values[-1] = values[-1].isoformat()  # date_recorded
+    return values
+
+
+def iter_export(rows, fmt):
+    # Serialize rows to CSV or JSONL, yielding text in chunks of roughly CHUNK_SIZE
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(_values(row))
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(COLUMNS, _values(row)))))
+            buffer.write('\n')
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode(chunks, compress=False):
+    # UTF-8 encode text chunks, optionally gzip-compressing them on the fly
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def filename(fmt, compress=False):
+    name = f"energy_usage_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return name + '.gz' if compress else name
+
+
+@click.command('export')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only these users (repeatable); default everyone.')
+@click.option('--energy-type', 'energy_types', multiple=True, help='Only these energy types (repeatable).')
+@click.option('--start', help='First day to include (YYYY-MM-DD).')
+@click.option('--end', help='Last day to include (YYYY-MM-DD).')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None,
+              help='Output file (default: a timestamped file in the current directory).')
+def export_command(user_ids, energy_types, start, end, fmt, compress, output):
+    """Export energy usage readings as CSV or JSONL."""
+    try:
+        start, end = parse_day(start), parse_day(end, end=True)
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+    rows = iter_readings(list(user_ids), list(energy_types), start, end)
+    output = output or filename(fmt, compress)
+    with open(output, 'wb') as f:
+        for data in encode(iter_export(rows, fmt), compress):
+            f.write(data)
+    click.echo(f'Wrote {output}')
@@ -0,0 +1,20 @@
+# fileio.py
+import os
+import threading
+
+
+def write_atomic(path, write):
+    # Write through a temp file next to path and rename it into place, so readers see either the
+    # old file or the whole new one, never a partial write. write(f) fills the binary file object.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'  # Unique per writer thread
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
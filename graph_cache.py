@@ -0,0 +1,83 @@
+# graph_cache.py
+import hashlib
+import os
+import re
+import time
+from flask import current_app
+import fileio
+
+FILENAME_PATTERN = re.compile(r'^[a-z]+_(bar|line)_graph_(\d+)_[0-9a-f]{16}\.png$')
+
+
+def graph_filename(user_id, energy_type, kind, labels, values):
+    # Content-addressed name: an unchanged series always maps to the same file
+    digest = hashlib.sha1(repr((list(labels), [float(v) for v in values])).encode('utf-8')).hexdigest()[:16]
+    return f'{energy_type}_{kind}_graph_{user_id}_{digest}.png'
+
+
+def graph_owner(filename):
+    # User id encoded in a cache filename, or None if the name is not one of ours
+    match = FILENAME_PATTERN.match(filename)
+    return int(match.group(2)) if match else None
+
+
+def cache_dir():
+    path = current_app.config['GRAPH_CACHE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def contains(filename):
+    path = os.path.join(cache_dir(), filename)
+    if not os.path.exists(path):
+        return False
+    # Bump the mtime so eviction treats the file as recently used
+    try:
+        os.utime(path, None)
+    except OSError:
+        return False
+    return True
+
+
+def load(filename):
+    try:
+        with open(os.path.join(cache_dir(), filename), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store(filename, data):
+    fileio.write_atomic(os.path.join(cache_dir(), filename), lambda f: f.write(data))
+
+
+def evict(keep=()):
+    # Files named in keep (just rendered or referenced by the page being served) are left alone
+    directory = cache_dir()
+    max_files = current_app.config['GRAPH_CACHE_MAX_FILES']
+    max_age = current_app.config['GRAPH_CACHE_MAX_AGE']
+    grace = current_app.config['GRAPH_CACHE_GRACE']
+    now = time.time()
+
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith('.png'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue  # Removed by another worker
+        entries.append((mtime, name, path))
+
+    # Drop anything older than the age limit, then the least recently used beyond the size limit,
+    # but never a file used within the grace period: another page may be about to fetch it
+    entries.sort(reverse=True)
+    for index, (mtime, name, path) in enumerate(entries):
+        if name in keep or now - mtime <= grace:
+            continue
+        if index >= max_files or now - mtime > max_age:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
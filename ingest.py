@@ -0,0 +1,213 @@
+# ingest.py
+import codecs
+import csv
+import json
+import math
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from sqlalchemy import insert, or_
+from models import User, EnergyUsage
+from __init__ import db
+import rollup
+
+ENERGY_TYPES = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
+
+
+class RowError(ValueError):
+    pass
+
+
+def _decoded_lines(stream, bad_lines):
+    # Decode the binary stream a line at a time, so bytes that are not UTF-8 only cost the rows on
+    # that line: it is passed on with U+FFFD replacements and its number is added to bad_lines
+    for line_number, raw in enumerate(stream, start=1):
+        if line_number == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_number)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def iter_rows(stream, fmt):
+    # Yield (line_number, record) from a binary stream without reading it all into memory
+    bad_lines = set()
+    lines = _decoded_lines(stream, bad_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        reader.fieldnames  # Reads the header, so the first record starts after it
+        previous = reader.line_num
+        for record in reader:
+            # A quoted field can span lines; the record is bad if any of its lines is
+            if not bad_lines.isdisjoint(range(previous + 1, reader.line_num + 1)):
+                record = RowError('not valid UTF-8')
+            previous = reader.line_num
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line_number in bad_lines:
+                yield line_number, RowError('not valid UTF-8')
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f'invalid JSON: {e}')
+                continue
+            yield line_number, record if isinstance(record, dict) else RowError('expected a JSON object')
+    else:
+        raise ValueError(f'unsupported format: {fmt}')
+
+
+def guess_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+class MeterDirectory:
+    # Maps meter numbers to (user_id, energy_type), looked up a batch at a time and memoized
+
+    def __init__(self):
+        self.meters = {}
+
+    def resolve(self, meter_numbers):
+        missing = {number for number in meter_numbers if number not in self.meters}
+        if missing:
+            users = db.session.query(User.id, User.electricity_meter_number, User.water_meter_number).filter(
+                or_(User.electricity_meter_number.in_(missing), User.water_meter_number.in_(missing))
+            ).all()
+            for user_id, electricity_meter, water_meter in users:
+                if electricity_meter in missing:
+                    self.meters[electricity_meter] = (user_id, 'electricity')
+                if water_meter in missing:
+                    self.meters[water_meter] = (user_id, 'water')
+            for number in missing:
+                self.meters.setdefault(number, None)
+        return self.meters
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if len(value) == 10 else datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f'invalid date_recorded: {value!r}')
+
+
+def parse_record(record):
+    # Validate one input record; returns (meter_number, energy_type or None, units_used, date_recorded)
+    meter_number = str(record.get('meter_number') or '').strip()
+    if not meter_number:
+        raise RowError('missing meter_number')
+
+    try:
+        units_used = float(record.get('units_used'))
+    except (TypeError, ValueError):
+        raise RowError(f"invalid units_used: {record.get('units_used')!r}")
+    if not math.isfinite(units_used) or units_used < 0:
+        raise RowError(f'units_used out of range: {units_used}')
+
+    energy_type = (record.get('energy_type') or '').strip() or None
+    if energy_type is not None and energy_type not in ENERGY_TYPES:
+        raise RowError(f'unknown energy_type: {energy_type!r}')
+
+    return meter_number, energy_type, units_used, _parse_date(record.get('date_recorded'))
+
+
+def _flush(batch, directory, result):
+    # Resolve meters for the batch, insert valid rows with one executemany and commit
+    meters = directory.resolve({row[1][0] for row in batch})
+    values = []
+    accepted_lines = []
+    for line_number, (meter_number, energy_type, units_used, date_recorded) in batch:
+        owner = meters.get(meter_number)
+        if owner is None:
+            _reject(result, line_number, f'unknown meter_number: {meter_number!r}')
+            continue
+        user_id, meter_type = owner
+        if energy_type is not None and energy_type != meter_type:
+            _reject(result, line_number, f'meter {meter_number!r} records {meter_type}, not {energy_type}')
+            continue
+        values.append({'user_id': user_id, 'meter_number': meter_number, 'energy_type': meter_type,
+                       'units_used': units_used, 'date_recorded': date_recorded})
+        accepted_lines.append(line_number)
+
+    if not values:
+        return
+    try:
+        db.session.execute(insert(EnergyUsage), values)
+        rollup.add_readings((row['user_id'], row['energy_type'], row['date_recorded'], row['units_used']) for row in values)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for line_number in accepted_lines:
+            _reject(result, line_number, f'batch failed: {e.__class__.__name__}')
+        return
+    result['rows_inserted'] += len(values)
+    result['batches'] += 1
+
+
+def _reject(result, line_number, message):
+    result['rows_rejected'] += 1
+    if len(result['errors']) < current_app.config['INGEST_MAX_ERRORS']:
+        result['errors'].append({'line': line_number, 'error': message})
+
+
+def ingest_stream(stream, fmt, batch_size=None):
+    # Stream meter readings from a CSV/JSONL file object into EnergyUsage, committing per batch
+    batch_size = batch_size or current_app.config['INGEST_BATCH_SIZE']
+    directory = MeterDirectory()
+    result = {'rows_read': 0, 'rows_inserted': 0, 'rows_rejected': 0, 'batches': 0, 'errors': []}
+    started = time.perf_counter()
+
+    batch = []
+    try:
+        for line_number, record in iter_rows(stream, fmt):
+            result['rows_read'] += 1
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                batch.append((line_number, parse_record(record)))
+            except RowError as e:
+                _reject(result, line_number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                _flush(batch, directory, result)
+                batch = []
+    except csv.Error as e:
+        # The rest of the file cannot be split into rows (e.g. a NUL byte); keep what was read before it
+        result['error'] = f'stopped reading after {result["rows_read"]} rows: {e}'
+    if batch:
+        _flush(batch, directory, result)
+    # Meter errors are found per batch, after the parse errors of later lines
+    result['errors'].sort(key=lambda error: error['line'])
+
+    elapsed = time.perf_counter() - started
+    result['seconds'] = round(elapsed, 3)
+    result['rows_per_second'] = round(result['rows_inserted'] / elapsed, 1) if elapsed > 0 else None
+    return result
+
+
+@click.command('ingest')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format (default: from the file extension, else csv).')
+@click.option('--batch-size', type=int, default=None, help='Rows per insert batch and commit.')
+def ingest_command(path, fmt, batch_size):
+    """Bulk load meter readings from a CSV or JSONL file."""
+    with open(path, 'rb') as stream:
+        result = ingest_stream(stream, fmt or guess_format(path), batch_size)
+    for error in result['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if 'error' in result:
+        click.echo(result['error'], err=True)
+    click.echo(f"{result['rows_inserted']} inserted, {result['rows_rejected']} rejected, "
+               f"{result['rows_read']} read in {result['seconds']}s ({result['rows_per_second']} rows/s)")
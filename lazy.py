@@ -0,0 +1,9 @@
+# lazy.py
+#
+# Heavy optional modules, imported on first use so create_app, CLI commands and migrations
+# do not pay for them. Call the accessor inside the function that needs the module.
+
+
+def numpy():
+    import numpy  # After the first call this is a lookup in sys.modules
+    return numpy
@@ -0,0 +1,225 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+# Histogram upper bounds (Prometheus "le"); the last bucket is +Inf
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+HELP = {
+    'http_request_duration_seconds': ('Request latency, including streamed bodies.', SECONDS_BUCKETS),
+    'http_request_sql_queries': ('SQL statements executed per request.', COUNT_BUCKETS),
+    'http_request_sql_seconds': ('Time spent in SQL per request.', SECONDS_BUCKETS),
+    'sql_query_duration_seconds': ('Latency of individual SQL statements.', SECONDS_BUCKETS),
+    'render_duration_seconds': ('Chart (matplotlib) and template (Jinja) render time.', SECONDS_BUCKETS),
+    'write_behind_batch_size': ('Readings per write-behind group commit.', COUNT_BUCKETS),
+    'write_behind_commit_seconds': ('Time to insert and commit one write-behind batch.', SECONDS_BUCKETS),
+    'write_behind_queue_depth': ('Readings waiting in the write-behind queue.', None),  # Gauge
+    'password_hash_seconds': ('Time to compute one password hash.', SECONDS_BUCKETS),
+    'password_hash_wait_seconds': ('Time a password hash waited for a worker.', SECONDS_BUCKETS),
+    'password_hash_in_flight': ('Password hashes running or waiting for a worker.', None),  # Gauge
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]  # Falls in +Inf; report the largest finite bound
+
+
+_lock = threading.Lock()
+_histograms = {}  # (name, sorted label items) -> Histogram
+_gauges = {}  # (name, sorted label items) -> callable returning the current value
+
+
+def observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(HELP[name][1])
+        histogram.observe(value)
+
+
+def gauge(name, read, **labels):
+    # Register a callable sampled whenever metrics are read
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = read
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _request_state():
+    # Per-request accumulators, or None outside a request (CLI commands, batch jobs)
+    return g.get('_metrics') if has_app_context() else None
+
+
+@contextmanager
+def timed(kind):
+    # with metrics.timed('chart'): ... records render_duration_seconds{kind="chart"}
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        state = _request_state()
+        if state is not None:
+            state['render'][kind] = state['render'].get(kind, 0.0) + elapsed
+        observe('render_duration_seconds', elapsed, kind=kind, endpoint=state['endpoint'] if state else 'none')
+
+
+def _before_request():
+    g._metrics = {'endpoint': request.endpoint or 'unknown', 'started': time.perf_counter(),
+                  'sql_queries': 0, 'sql_seconds': 0.0, 'render': {}, 'template_started': None}
+
+
+def _after_request_factory(app):
+    def _after_request(response):
+        state = g.get('_metrics')
+        if state is None:
+            return response
+        method = request.method
+        path = request.full_path.rstrip('?')
+        logger = app.logger
+        threshold = app.config['METRICS_SLOW_REQUEST_MS']
+
+        def finish():
+            # Runs once the body has been sent, so streamed pages are timed end to end
+            elapsed = time.perf_counter() - state['started']
+            endpoint = state['endpoint']
+            observe('http_request_duration_seconds', elapsed, endpoint=endpoint, method=method,
+                    status=str(response.status_code))
+            observe('http_request_sql_queries', state['sql_queries'], endpoint=endpoint)
+            observe('http_request_sql_seconds', state['sql_seconds'], endpoint=endpoint)
+            if threshold is not None and elapsed * 1000 >= threshold:
+                render = ' '.join(f'{kind}={seconds * 1000:.1f}ms' for kind, seconds in state['render'].items())
+                other = elapsed - state['sql_seconds'] - sum(state['render'].values())
+                logger.warning('Slow request %s %s -> %s in %.1fms: sql=%d queries/%.1fms %s other=%.1fms',
+                               method, path, response.status_code, elapsed * 1000, state['sql_queries'],
+                               state['sql_seconds'] * 1000, render, max(other, 0) * 1000)
+
+        response.call_on_close(finish)
+        return response
+    return _after_request
+
+
+def _before_render_template(sender, template, context, **extra):
+    state = _request_state()
+    if state is not None:
+        state['template_started'] = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    state = _request_state()
+    if state is not None and state['template_started'] is not None:
+        elapsed = time.perf_counter() - state['template_started']
+        state['template_started'] = None
+        state['render']['template'] = state['render'].get('template', 0.0) + elapsed
+        observe('render_duration_seconds', elapsed, kind='template', endpoint=state['endpoint'])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_metrics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    state = _request_state()
+    if state is not None:
+        state['sql_queries'] += 1
+        state['sql_seconds'] += elapsed
+    observe('sql_query_duration_seconds', elapsed, endpoint=state['endpoint'] if state else 'none')
+
+
+def install(app, db):
+    # Called after db.init_app: request hooks, template signals and SQL timing for this app
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request_factory(app))
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def snapshot():
+    # {name: [{labels, count, sum, p50, p95, p99, buckets}]} for the JSON endpoint; gauges are [{labels, value}]
+    with _lock:
+        items = [(name, labels, histogram.buckets, list(histogram.counts), histogram.count, histogram.sum,
+                  [histogram.quantile(q) for q in (0.5, 0.95, 0.99)])
+                 for (name, labels), histogram in sorted(_histograms.items())]
+        gauges = sorted(_gauges.items())
+    result = {}
+    for (name, labels), read in gauges:
+        result.setdefault(name, []).append({'labels': dict(labels), 'value': read()})
+    for name, labels, buckets, counts, count, total, (p50, p95, p99) in items:
+        cumulative = 0
+        bucket_counts = {}
+        for upper, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            bucket_counts[str(upper)] = cumulative
+        result.setdefault(name, []).append({
+            'labels': dict(labels), 'count': count, 'sum': round(total, 6),
+            'p50': p50, 'p95': p95, 'p99': p99, 'buckets': bucket_counts,
+        })
+    return result
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def prometheus_text():
+    # Prometheus text exposition format 0.0.4
+    lines = []
+    for name, series in snapshot().items():
+        lines.append(f'# HELP {name} {HELP[name][0]}')
+        lines.append(f'# TYPE {name} {"gauge" if HELP[name][1] is None else "histogram"}')
+        for entry in series:
+            labels = ','.join(f'{key}="{_escape(value)}"' for key, value in entry['labels'].items())
+            braced = f'{{{labels}}}' if labels else ''
+            if 'value' in entry:
+                lines.append(f'{name}{braced} {entry["value"]}')
+                continue
+            prefix = labels + ',' if labels else ''
+            for upper, count in entry['buckets'].items():
+                lines.append(f'{name}_bucket{{{prefix}le="{upper}"}} {count}')
+            lines.append(f'{name}_sum{braced} {entry["sum"]}')
+            lines.append(f'{name}_count{braced} {entry["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,63 @@
+"""initial schema
+
+Revision ID: 1a2b3c4d5e6f
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e6f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables as previously created by db.create_all(); existing databases
+    # should be stamped at this revision with `flask db stamp 1a2b3c4d5e6f`
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('firstname', sa.String(length=100), nullable=True),
+    sa.Column('lastname', sa.String(length=100), nullable=True),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('password_hash', sa.String(length=128), nullable=True),
+    sa.Column('is_admin', sa.Boolean(), nullable=True),
+    sa.Column('electricity_meter_number', sa.String(length=100), nullable=True),
+    sa.Column('water_meter_number', sa.String(length=100), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_email'), ['email'], unique=True)
+
+    op.create_table('energy_usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('meter_number', sa.String(length=100), nullable=True),
+    sa.Column('units_used', sa.Float(), nullable=True),
+    sa.Column('date_recorded', sa.DateTime(), nullable=True),
+    sa.Column('energy_type', sa.String(length=50), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('recommendations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable=True),
+    sa.Column('energy_type', sa.String(length=50), nullable=True),
+    sa.Column('recommendation', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendations')
+    op.drop_table('energy_usage')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_email'))
+
+    op.drop_table('user')
@@ -0,0 +1,26 @@
+"""energy_usage composite index
+
+Revision ID: 2b3c4d5e6f70
+Revises: 1a2b3c4d5e6f
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b3c4d5e6f70'
+down_revision = '1a2b3c4d5e6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('energy_usage', schema=None) as batch_op:
+        batch_op.create_index('ix_energy_usage_user_type_date', ['user_id', 'energy_type', 'date_recorded'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('energy_usage', schema=None) as batch_op:
+        batch_op.drop_index('ix_energy_usage_user_type_date')
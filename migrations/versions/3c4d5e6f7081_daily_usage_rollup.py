@@ -0,0 +1,43 @@
+"""daily usage rollup
+
+Revision ID: 3c4d5e6f7081
+Revises: 2b3c4d5e6f70
+Create Date: 2026-10-17 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c4d5e6f7081'
+down_revision = '2b3c4d5e6f70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_usage',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('energy_type', sa.String(length=50), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('units_total', sa.Float(), nullable=False),
+    sa.Column('units_min', sa.Float(), nullable=True),
+    sa.Column('units_max', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'energy_type', 'day')
+    )
+
+    # Backfill from the existing readings
+    op.execute(
+        'INSERT INTO daily_usage (user_id, energy_type, day, reading_count, units_total, units_min, units_max) '
+        'SELECT user_id, energy_type, DATE(date_recorded), COUNT(id), SUM(units_used), MIN(units_used), MAX(units_used) '
+        'FROM energy_usage '
+        'WHERE user_id IS NOT NULL AND energy_type IS NOT NULL AND date_recorded IS NOT NULL AND units_used IS NOT NULL '
+        'GROUP BY user_id, energy_type, DATE(date_recorded)'
+    )
+
+
+def downgrade():
+    op.drop_table('daily_usage')
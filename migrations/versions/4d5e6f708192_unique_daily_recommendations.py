@@ -0,0 +1,31 @@
+"""unique daily recommendations
+
+Revision ID: 4d5e6f708192
+Revises: 3c4d5e6f7081
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d5e6f708192'
+down_revision = '3c4d5e6f7081'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The old page view inserted a row per reading on every visit; keep only the newest duplicate
+    op.execute(
+        'DELETE FROM recommendations WHERE id NOT IN ('
+        'SELECT MAX(id) FROM recommendations GROUP BY user_id, energy_type, date)'
+    )
+    with op.batch_alter_table('recommendations', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_recommendations_user_type_date', ['user_id', 'energy_type', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('recommendations', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_recommendations_user_type_date', type_='unique')
@@ -0,0 +1,31 @@
+"""usage sketches
+
+Revision ID: 6f708192a3b4
+Revises: 5e6f708192a3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f708192a3b4'
+down_revision = '5e6f708192a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Starts empty; fill it from existing readings with `flask rebuild-sketches`
+    op.create_table('usage_sketch',
+    sa.Column('energy_type', sa.String(length=50), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('energy_type', 'period')
+    )
+
+
+def downgrade():
+    op.drop_table('usage_sketch')
@@ -0,0 +1,33 @@
+"""archive chunks
+
+Revision ID: 708192a3b4c5
+Revises: 6f708192a3b4
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '708192a3b4c5'
+down_revision = '6f708192a3b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Starts empty; readings move here with `flask archive-readings`
+    op.create_table('archive_chunk',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('energy_type', sa.String(length=50), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'energy_type', 'year')
+    )
+
+
+def downgrade():
+    # Archived readings are only reachable through this table; move them back before downgrading
+    op.drop_table('archive_chunk')
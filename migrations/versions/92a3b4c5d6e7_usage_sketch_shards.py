@@ -0,0 +1,44 @@
+"""usage sketch shards
+
+Revision ID: 92a3b4c5d6e7
+Revises: 8192a3b4c5d6
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92a3b4c5d6e7'
+down_revision = '8192a3b4c5d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The primary key gains a column, so the table is rebuilt; existing sketches become shard 0
+    op.create_table('usage_sketch_new',
+    sa.Column('energy_type', sa.String(length=50), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('shard', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('energy_type', 'period', 'shard', name='pk_usage_sketch')
+    )
+    op.execute('INSERT INTO usage_sketch_new (energy_type, period, shard, reading_count, digest) '
+               'SELECT energy_type, period, 0, reading_count, digest FROM usage_sketch')
+    op.drop_table('usage_sketch')
+    op.rename_table('usage_sketch_new', 'usage_sketch')
+
+
+def downgrade():
+    # Shards cannot be merged in SQL; the table comes back empty, refill it with `flask rebuild-sketches`
+    op.drop_table('usage_sketch')
+    op.create_table('usage_sketch',
+    sa.Column('energy_type', sa.String(length=50), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('energy_type', 'period')
+    )
@@ -0,0 +1,33 @@
+"""widen password hash
+
+Revision ID: a3b4c5d6e7f8
+Revises: 92a3b4c5d6e7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3b4c5d6e7f8'
+down_revision = '92a3b4c5d6e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # scrypt hashes (the default method, written again by rehash-on-login) are ~162 characters
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=128),
+               type_=sa.String(length=255),
+               existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=128),
+               existing_nullable=True)
@@ -0,0 +1,33 @@
+"""user nocase indexes
+
+Revision ID: b4c5d6e7f8a9
+Revises: a3b4c5d6e7f8
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4c5d6e7f8a9'
+down_revision = 'a3b4c5d6e7f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The directory searches and sorts without regard to case, so its indexes use the NOCASE collation
+    op.drop_index('ix_user_firstname', table_name='user')
+    op.drop_index('ix_user_name', table_name='user')
+    op.create_index('ix_user_name', 'user', [sa.text('lastname COLLATE NOCASE'), sa.text('firstname COLLATE NOCASE')], unique=False)
+    op.create_index('ix_user_firstname', 'user', [sa.text('firstname COLLATE NOCASE')], unique=False)
+    op.create_index('ix_user_email_nocase', 'user', [sa.text('email COLLATE NOCASE')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_email_nocase', table_name='user')
+    op.drop_index('ix_user_firstname', table_name='user')
+    op.drop_index('ix_user_name', table_name='user')
+    op.create_index('ix_user_name', 'user', ['lastname', 'firstname'], unique=False)
+    op.create_index('ix_user_firstname', 'user', ['firstname'], unique=False)
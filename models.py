@@ -1,6 +1,6 @@
 # models.py
 from __init__ import db  # Import db from __init__ using explicit import
-from werkzeug.security import generate_password_hash, check_password_hash
+import passwords
 from flask_login import UserMixin
 from datetime import datetime
 
@@ -9,16 +9,24 @@ class User(UserMixin, db.Model):
     firstname = db.Column(db.String(100))
     lastname = db.Column(db.String(100))
     email = db.Column(db.String(120), unique=True, index=True)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))  # scrypt hashes are ~162 characters
     is_admin = db.Column(db.Boolean, default=False)  # False for regular users, True for admins
     electricity_meter_number = db.Column(db.String(100), nullable=True)  # Nullable if not all users will have this info
     water_meter_number = db.Column(db.String(100), nullable=True)  # Nullable if not all users will have this info
+    usage_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every usage write; ETag for /api/usage/series
+
+    # Admin user directory: sorted by name, and searched by email or first/last name prefix ignoring case
+    __table_args__ = (
+        db.Index('ix_user_name', lastname.collate('NOCASE'), firstname.collate('NOCASE')),
+        db.Index('ix_user_firstname', firstname.collate('NOCASE')),
+        db.Index('ix_user_email_nocase', email.collate('NOCASE')),
+    )
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.check_password(self.password_hash, password)
 
 
 
@@ -30,10 +38,54 @@ class EnergyUsage(db.Model):
     date_recorded = db.Column(db.DateTime, default=db.func.current_timestamp())
     energy_type = db.Column(db.String(50))
 
+    # Every per-user query filters on user and energy type, then a date range
+    __table_args__ = (
+        db.Index('ix_energy_usage_user_type_date', 'user_id', 'energy_type', 'date_recorded'),
+    )
+
     def __repr__(self):
         return f'<EnergyUsage {self.energy_type} {self.units_used}>'
 
 
+class DailyUsage(db.Model):
+    # Per-day rollup of EnergyUsage, kept in step with every write (see rollup.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    energy_type = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    units_total = db.Column(db.Float, nullable=False, default=0.0)
+    units_min = db.Column(db.Float)
+    units_max = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<DailyUsage {self.user_id} {self.energy_type} {self.day}: {self.units_total}>'
+
+
+class UsageSketch(db.Model):
+    # t-digest of every reading's units_used per energy type and calendar month (see sketches.py).
+    # Writers spread over SKETCH_SHARDS rows per month; readers merge them.
+    energy_type = db.Column(db.String(50), primary_key=True)
+    period = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM'
+    shard = db.Column(db.Integer, primary_key=True, default=0, autoincrement=False)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    digest = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<UsageSketch {self.energy_type} {self.period}/{self.shard}: {self.reading_count}>'
+
+
+class ArchiveChunk(db.Model):
+    # Catalogue of readings moved out of EnergyUsage: memory-mapped column files per user, energy type
+    # and year (see archive.py). reading_count names the committed generation of those files.
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    energy_type = db.Column(db.String(50), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ArchiveChunk {self.user_id} {self.energy_type} {self.year}: {self.reading_count}>'
+
+
 class Recommendations(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -41,5 +93,10 @@ class Recommendations(db.Model):
     energy_type = db.Column(db.String(50))
     recommendation = db.Column(db.Text)
 
+    # One recommendation per user, energy type and day (see recommender.py)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'energy_type', 'date', name='uq_recommendations_user_type_date'),
+    )
+
     def __repr__(self):
         return f'<Recommendation {self.date}: {self.recommendation}>'
\ No newline at end of file
@@ -0,0 +1,57 @@
+# pagination.py
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(date_recorded, record_id):
+    raw = f'{date_recorded.isoformat()}|{record_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns (date_recorded, id), or None for a missing or malformed cursor
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
+
+def keyset_page(query, date_column, id_column, page_size, after=None, before=None):
+    # Newest-first page of query ordered by (date, id). 'after' is the cursor of the last row
+    # of the current page (go to older rows), 'before' the cursor of its first row (go to newer).
+    # Returns (rows, next_cursor, prev_cursor); a cursor is None when there is no such page.
+    if before is not None:
+        cursor_date, cursor_id = before
+        rows = query.filter(
+            date_column >= cursor_date,
+            or_(date_column > cursor_date, and_(date_column == cursor_date, id_column > cursor_id))
+        ).order_by(date_column.asc(), id_column.asc()).limit(page_size + 1).all()
+        has_newer = len(rows) > page_size
+        rows = list(reversed(rows[:page_size]))
+        has_older = True
+    else:
+        if after is not None:
+            cursor_date, cursor_id = after
+            query = query.filter(
+                date_column <= cursor_date,
+                or_(date_column < cursor_date, and_(date_column == cursor_date, id_column < cursor_id))
+            )
+        rows = query.order_by(date_column.desc(), id_column.desc()).limit(page_size + 1).all()
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = after is not None
+
+    if not rows:
+        return rows, None, None
+
+    def cursor(row):
+        return encode_cursor(getattr(row, date_column.key), getattr(row, id_column.key))
+
+    next_cursor = cursor(rows[-1]) if has_older else None
+    prev_cursor = cursor(rows[0]) if has_newer else None
+    return rows, next_cursor, prev_cursor
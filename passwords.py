@@ -0,0 +1,93 @@
+# passwords.py
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+import metrics
+
+
+class HasherBusy(Exception):
+    # Every hashing slot stayed taken for PASSWORD_HASH_WAIT seconds; answered with a 503
+    pass
+
+
+class Hasher:
+    # Password hashes run on a small thread pool (hashlib's scrypt/pbkdf2 release the GIL), so a burst
+    # of logins uses at most PASSWORD_HASH_WORKERS cores. This bounds concurrency, not threads: the
+    # request thread still blocks until its hash is done. Logins therefore hold at most
+    # PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE server threads (plus callers waiting up to
+    # PASSWORD_HASH_WAIT for a slot); keep that below the server's thread count so other pages
+    # still get a thread during a login spike. Callers that find no slot get a 503.
+
+    def __init__(self, app):
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.wait = app.config['PASSWORD_HASH_WAIT']
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + app.config['PASSWORD_HASH_QUEUE'])
+        self._pool = None
+        self._lock = threading.Lock()
+        self.in_flight = 0  # Hashes running or waiting for a worker
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._pool
+
+    def run(self, operation, function, *args):
+        # With PASSWORD_HASH_WORKERS == 0 the hash runs inline in the calling thread
+        started = time.perf_counter()
+
+        def timed():
+            began = time.perf_counter()
+            metrics.observe('password_hash_wait_seconds', began - started, operation=operation)
+            try:
+                return function(*args)
+            finally:
+                metrics.observe('password_hash_seconds', time.perf_counter() - began, operation=operation)
+
+        if not self._slots.acquire(timeout=self.wait):
+            raise HasherBusy()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            if self.workers <= 0:
+                return timed()
+            return self._get_pool().submit(timed).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+
+def install(app):
+    hasher = app.extensions['password_hasher'] = Hasher(app)
+    metrics.gauge('password_hash_in_flight', lambda: hasher.in_flight)
+    app.register_error_handler(HasherBusy, _busy)
+
+
+def _busy(error):
+    return 'Too many sign-ins at the moment, please try again in a few seconds.', 503, {'Retry-After': '2'}
+
+
+@functools.lru_cache(maxsize=8)
+def _stored_method(method):
+    # The parameter prefix werkzeug writes for a method, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return current_app.extensions['password_hasher'].run('hash', generate_password_hash, password, method)
+
+
+def check_password(password_hash, password):
+    if not password_hash or password is None:
+        return False
+    return current_app.extensions['password_hasher'].run('verify', check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    # True when the hash was made with other parameters than PASSWORD_HASH_METHOD (stronger or weaker)
+    return password_hash.split('$', 1)[0] != _stored_method(current_app.config['PASSWORD_HASH_METHOD'])
@@ -0,0 +1,143 @@
+# query_plans.py
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import click
+import flask_migrate
+from sqlalchemy import event
+
+# The scratch database is built by the shipped migrations, so a missing or misnamed index fails here
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Routes whose usage queries must be served from an index, with the query strings to exercise
+USER_ROUTES = [
+    '/users/dashboard',
+    '/users/history?time_period=7 days&aggregate=all',
+    '/users/history?time_period=6 months&aggregate=aggregate',
+    '/users/history?time_period=custom&start=2000-01-01&aggregate=all',
+    '/users/power_usage',
+    '/users/recommendations',
+    '/api/usage/series?interval=daily',
+    '/api/usage/series?interval=weekly',
+    '/api/usage/series?interval=monthly',
+    '/api/usage/history?energy_type=electricity&points=4',
+    '/api/usage/history?energy_type=water&points=4&method=lttb',
+]
+ADMIN_ROUTES = [
+    '/Admin/history/{user_id}?time_period=30 days&aggregate=all',
+    '/Admin/history/{user_id}?time_period=3 months&aggregate=aggregate',
+    '/api/usage/history?user_id={user_id}&energy_type=electricity',
+]
+
+# Tables holding per-user data; SQLite reports a full pass over a table
+# (or over a whole index) as "SCAN <table>"
+USAGE_TABLES = ('energy_usage', 'daily_usage', 'recommendations', 'archive_chunk')
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(%s)\b' % '|'.join(USAGE_TABLES))
+
+
+def _seed(db, User, EnergyUsage, rollup):
+    user = User(firstname='Plan', lastname='User', email='plan-user@example.com', is_admin=False)
+    user.set_password('password')
+    admin = User(firstname='Plan', lastname='Admin', email='plan-admin@example.com', is_admin=True)
+    admin.set_password('password')
+    db.session.add_all([user, admin])
+    db.session.flush()
+
+    now = datetime.now()
+    for energy_type in ['electricity', 'water', 'naturalgas', 'vehiclefuel']:
+        for day in range(14):
+            db.session.add(EnergyUsage(user_id=user.id, energy_type=energy_type, units_used=10.0 + day,
+                                       date_recorded=now - timedelta(days=day)))
+    db.session.flush()
+    rollup.rebuild()
+    db.session.commit()
+    return user.id
+
+
+def _explain(engine, statement, parameters):
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans():
+    # Runs each route against a scratch SQLite database and returns a list of
+    # (route, statement, plan, ok) for every usage query it issued; route is the entry
+    # from USER_ROUTES or ADMIN_ROUTES
+    from __init__ import create_app, db
+    from models import User, EnergyUsage
+    import rollup
+
+    workdir = tempfile.mkdtemp(prefix='query_plans_')
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'plans.db'),
+            'GRAPH_CACHE_DIR': os.path.join(workdir, 'graph_cache'),
+            'CHART_RENDER_WORKERS': 0,
+        })
+        with app.app_context():
+            flask_migrate.upgrade(directory=MIGRATIONS_DIR)
+            user_id = _seed(db, User, EnergyUsage, rollup)
+            engine = db.engine
+
+        results = []
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and any(table in statement for table in USAGE_TABLES):
+                captured.append((statement, parameters))
+
+        def run(client, route, url):
+            # Requests run outside our app context so each gets its own g and login state
+            captured.clear()
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                response = client.get(url)
+                response.get_data()  # Streamed pages run their queries while the body is read
+                response.close()
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+            if not captured:
+                results.append((route, None, [], False))
+            for statement, parameters in list(captured):
+                plan = _explain(engine, statement, parameters)
+                ok = not any(FULL_SCAN.match(detail) for detail in plan)
+                results.append((route, statement, plan, ok))
+
+        client = app.test_client()
+        client.post('/auth/login', data={'email': 'plan-user@example.com', 'password': 'password'})
+        for route in USER_ROUTES:
+            run(client, route, route)
+
+        client = app.test_client()
+        client.post('/auth/login', data={'email': 'plan-admin@example.com', 'password': 'password'})
+        for route in ADMIN_ROUTES:
+            run(client, route, route.format(user_id=user_id))
+
+        engine.dispose()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@click.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any route's usage query falls back to a full table scan."""
+    failures = 0
+    for route, statement, plan, ok in check_query_plans():
+        if statement is None:
+            click.echo(f'FAIL {route}: issued no usage query')
+            failures += 1
+            continue
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {route}")
+        for detail in plan:
+            click.echo(f'       {detail}')
+        if not ok:
+            click.echo(f"       {' '.join(statement.split())}")
+            failures += 1
+
+    if failures:
+        raise click.ClickException(f'{failures} quer{"y" if failures == 1 else "ies"} without a usable index')
+    click.echo('All usage queries use an index.')
@@ -0,0 +1,130 @@
+# recommender.py
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import func
+from models import User, DailyUsage, Recommendations
+from __init__ import db
+import lazy
+
+WINDOW_DAYS = 7
+BATCH_USERS = 5000  # Users processed per query/upsert round
+
+BELOW_AVERAGE = "Congratulations! Your energy usage is below average."
+ABOVE_AVERAGE = "Consider reducing energy usage. Your usage is higher than usual."
+WEEKLY_PEAK = "Warning! Your energy usage today is the highest recorded in the past week."
+NO_CHANGE = "No specific recommendation for today. Continue to monitor energy usage."
+
+
+def classify(matrix):
+    # matrix: one row per (user, energy type), one column per day of the window, NaN where
+    # there is no reading. Compares each row's latest day against that row's own week.
+    # Returns (latest_offsets, messages) for rows that have at least one reading.
+    np = lazy.numpy()
+    has_data = ~np.isnan(matrix)
+    latest_offsets = matrix.shape[1] - 1 - np.argmax(has_data[:, ::-1], axis=1)
+    latest = matrix[np.arange(matrix.shape[0]), latest_offsets]
+
+    first_quartile, third_quartile = np.nanpercentile(matrix, [25, 75], axis=1)
+    highest = np.nanmax(matrix, axis=1)
+    days_with_data = has_data.sum(axis=1)
+
+    messages = np.select(
+        [(days_with_data > 1) & (latest == highest) & (latest > third_quartile),
+         latest > third_quartile,
+         latest < first_quartile],
+        [WEEKLY_PEAK, ABOVE_AVERAGE, BELOW_AVERAGE],
+        default=NO_CHANGE)
+    return latest_offsets, messages
+
+
+def _window(first_user_id, last_user_id, start_day, end_day):
+    # Daily totals of every user in the id range, as a (groups x days) matrix
+    rows = db.session.query(DailyUsage.user_id, DailyUsage.energy_type, DailyUsage.day, DailyUsage.units_total).filter(
+        DailyUsage.user_id >= first_user_id,
+        DailyUsage.user_id <= last_user_id,
+        DailyUsage.day >= start_day,
+        DailyUsage.day <= end_day
+    ).all()
+    if not rows:
+        return None
+
+    np = lazy.numpy()
+    user_ids = np.array([row[0] for row in rows])
+    energy_types = np.array([row[1] for row in rows])
+    offsets = np.array([(row[2] - start_day).days for row in rows])
+    totals = np.array([row[3] for row in rows], dtype=float)
+
+    groups, group_index = np.unique(np.stack([user_ids.astype(str), energy_types]), axis=1, return_inverse=True)
+    matrix = np.full((groups.shape[1], (end_day - start_day).days + 1), np.nan)
+    matrix[group_index.ravel(), offsets] = totals
+    return groups, matrix
+
+
+def _upsert(values):
+    # At most one recommendation per (user, energy type, day): insert or overwrite
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(Recommendations)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Recommendations.user_id, Recommendations.energy_type, Recommendations.date],
+            set_={'recommendation': statement.excluded.recommendation})
+        db.session.execute(statement, values)
+        return
+
+    for value in values:
+        existing = Recommendations.query.filter_by(user_id=value['user_id'], energy_type=value['energy_type'],
+                                                   date=value['date']).first()
+        if existing is None:
+            db.session.add(Recommendations(**value))
+        else:
+            existing.recommendation = value['recommendation']
+
+
+def generate(as_of=None, batch_users=BATCH_USERS):
+    # Recommendations for every user and energy type from the week ending on as_of.
+    # Idempotent: re-running overwrites the same (user, type, day) rows.
+    end_day = as_of or date.today()
+    start_day = end_day - timedelta(days=WINDOW_DAYS - 1)
+    lowest, highest = db.session.query(func.min(User.id), func.max(User.id)).one()
+    if lowest is None:
+        return 0
+
+    written = 0
+    for first_user_id in range(lowest, highest + 1, batch_users):
+        window = _window(first_user_id, first_user_id + batch_users - 1, start_day, end_day)
+        if window is None:
+            continue
+        groups, matrix = window
+        latest_offsets, messages = classify(matrix)
+
+        values = [{'user_id': int(user_id), 'energy_type': str(energy_type),
+                   'date': datetime.combine(start_day + timedelta(days=int(offset)), datetime.min.time()),
+                   'recommendation': str(message)}
+                  for (user_id, energy_type), offset, message in zip(groups.T, latest_offsets, messages)]
+        _upsert(values)
+        db.session.commit()
+        written += len(values)
+    return written
+
+
+def recent(user_id, days=WINDOW_DAYS):
+    # (date, energy_type, recommendation) for the user's last few days, newest first
+    since = datetime.combine(date.today() - timedelta(days=days - 1), datetime.min.time())
+    return db.session.query(Recommendations.date, Recommendations.energy_type, Recommendations.recommendation).filter(
+        Recommendations.user_id == user_id,
+        Recommendations.date >= since
+    ).order_by(Recommendations.date.desc(), Recommendations.energy_type).all()
+
+
+@click.command('generate-recommendations')
+@click.option('--date', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Last day of the week to evaluate (default: today).')
+@click.option('--batch-users', type=int, default=BATCH_USERS, show_default=True, help='Users per batch.')
+def generate_recommendations_command(as_of, batch_users):
+    """Upsert recommendations for all users; run daily from cron or a scheduler."""
+    written = generate(as_of.date() if as_of else None, batch_users)
+    click.echo(f'{written} recommendations written.')
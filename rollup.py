@@ -0,0 +1,142 @@
+# rollup.py
+from datetime import datetime
+import click
+from sqlalchemy import func, insert, select, delete, update
+from models import User, EnergyUsage, DailyUsage
+from __init__ import db
+import sketches
+import stats_cache
+import archive
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _summarize(readings):
+    # (user_id, energy_type, date_recorded, units_used) -> one row per (user, type, day)
+    rows = {}
+    for user_id, energy_type, date_recorded, units_used in readings:
+        units_used = float(units_used)
+        key = (user_id, energy_type, _day(date_recorded))
+        row = rows.get(key)
+        if row is None:
+            rows[key] = {'user_id': user_id, 'energy_type': energy_type, 'day': key[2],
+                         'reading_count': 1, 'units_total': units_used,
+                         'units_min': units_used, 'units_max': units_used}
+        else:
+            row['reading_count'] += 1
+            row['units_total'] += units_used
+            row['units_min'] = min(row['units_min'], units_used)
+            row['units_max'] = max(row['units_max'], units_used)
+    return list(rows.values())
+
+
+def _bump_usage_version(user_ids=None):
+    # Changes the ETag of the users' /api/usage/series responses
+    statement = update(User).values(usage_version=User.usage_version + 1)
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(user_ids))
+    db.session.execute(statement, execution_options={'synchronize_session': False})
+
+
+def add_readings(readings):
+    # Fold new readings into the rollup and the fleet sketches. Runs in the caller's session and
+    # transaction, so both commit (or roll back) together with the EnergyUsage rows.
+    readings = list(readings)
+    rows = _summarize(readings)
+    if not rows:
+        return
+    sketches.add_readings(readings)
+    stats_cache.usage_changed({row['energy_type'] for row in rows})  # Cached fleet stats go stale on commit
+    _bump_usage_version({row['user_id'] for row in rows})
+    _upsert(rows)
+
+
+def _upsert(rows):
+    # Add summarized rows to the rollup, merging with existing days
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+            smaller, larger = func.min, func.max  # Scalar min()/max() with two arguments
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+            smaller, larger = func.least, func.greatest
+        statement = upsert(DailyUsage)
+        statement = statement.on_conflict_do_update(
+            index_elements=[DailyUsage.user_id, DailyUsage.energy_type, DailyUsage.day],
+            set_={
+                'reading_count': DailyUsage.reading_count + statement.excluded.reading_count,
+                'units_total': DailyUsage.units_total + statement.excluded.units_total,
+                'units_min': smaller(DailyUsage.units_min, statement.excluded.units_min),
+                'units_max': larger(DailyUsage.units_max, statement.excluded.units_max),
+            })
+        db.session.execute(statement, rows)
+        return
+
+    # Other backends: read-modify-write through the ORM
+    for row in rows:
+        existing = db.session.get(DailyUsage, (row['user_id'], row['energy_type'], row['day']))
+        if existing is None:
+            db.session.add(DailyUsage(**row))
+        else:
+            existing.reading_count += row['reading_count']
+            existing.units_total += row['units_total']
+            existing.units_min = min(existing.units_min, row['units_min'])
+            existing.units_max = max(existing.units_max, row['units_max'])
+
+
+def rebuild(user_ids=None):
+    # Recompute the rollup from EnergyUsage and the archive, for everyone or only the given users
+    clear = delete(DailyUsage)
+    day = func.date(EnergyUsage.date_recorded)
+    source = select(
+        EnergyUsage.user_id, EnergyUsage.energy_type, day,
+        func.count(EnergyUsage.id), func.sum(EnergyUsage.units_used),
+        func.min(EnergyUsage.units_used), func.max(EnergyUsage.units_used)
+    ).where(EnergyUsage.user_id.is_not(None), EnergyUsage.energy_type.is_not(None),
+            EnergyUsage.date_recorded.is_not(None), EnergyUsage.units_used.is_not(None))
+    if user_ids is not None:
+        clear = clear.where(DailyUsage.user_id.in_(user_ids))
+        source = source.where(EnergyUsage.user_id.in_(user_ids))
+    source = source.group_by(EnergyUsage.user_id, EnergyUsage.energy_type, day)
+
+    stats_cache.usage_changed()
+    _bump_usage_version(user_ids)
+    db.session.execute(clear)
+    db.session.execute(insert(DailyUsage).from_select(
+        ['user_id', 'energy_type', 'day', 'reading_count', 'units_total', 'units_min', 'units_max'], source))
+    cold = _summarize((row.user_id, row.energy_type, row.date_recorded, row.units_used)
+                      for row in archive.iter_rows(user_ids) if row.units_used is not None)
+    if cold:
+        _upsert(cold)
+
+
+def totals(user_id, energy_type, start_day=None, end_day=None):
+    # Total units and number of readings, optionally limited to start_day..end_day inclusive
+    query = db.session.query(func.sum(DailyUsage.units_total), func.sum(DailyUsage.reading_count)).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.energy_type == energy_type
+    )
+    if start_day is not None:
+        query = query.filter(DailyUsage.day >= start_day)
+    if end_day is not None:
+        query = query.filter(DailyUsage.day <= end_day)
+    total, count = query.one()
+    return total or 0, count or 0
+
+
+def average(user_id, energy_type):
+    total, count = totals(user_id, energy_type)
+    return total / count if count else 0
+
+
+@click.command('rebuild-rollup')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only rebuild these users (repeatable).')
+def rebuild_rollup_command(user_ids):
+    """Recompute the daily usage rollup from the raw and archived readings."""
+    rebuild(list(user_ids) or None)
+    db.session.commit()
+    days = db.session.query(func.count()).select_from(DailyUsage).scalar()
+    click.echo(f'Daily usage rollup rebuilt ({days} user-days).')
@@ -1,15 +1,25 @@
 # routes.py
-from flask import Blueprint, render_template,  redirect, url_for, request, flash, current_app
+from flask import Blueprint, render_template, stream_template, redirect, url_for, request, flash, current_app, abort, Response, jsonify, stream_with_context
 from flask_login import current_user, login_required
 from models import User
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from models import EnergyUsage, Recommendations
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use this backend before importing pyplot
-import matplotlib.pyplot as plt
 from __init__ import db
+import binning
+import rollup
+import ingest
+import pagination
+import export
+import recommender
+import stats_cache
+import user_directory
+import user_cache
+import metrics
+import series
+import write_behind
+import sketches
+import downsample
+import archive
 
 routes_bp = Blueprint('routes', __name__)
 
@@ -25,18 +35,11 @@ def user_dashboard():
         return redirect(url_for('routes.admin_dashboard'))
     
     # Get the most recent recommendation
-    most_recent_recommendation = Recommendations.query.filter_by(user_id=current_user.id).order_by(Recommendations.id.desc()).first()
+    most_recent_recommendation = Recommendations.query.filter_by(user_id=current_user.id).order_by(Recommendations.date.desc(), Recommendations.id.desc()).first()
     
-    # Calculate average units used for water and electricity
-    average_electricity = db.session.query(func.round(func.avg(EnergyUsage.units_used))).filter(
-        EnergyUsage.user_id == current_user.id, 
-        EnergyUsage.energy_type == 'electricity'
-    ).scalar() or 0  # Default to 0 if no records are found
-
-    average_water = db.session.query(func.round(func.avg(EnergyUsage.units_used))).filter(
-        EnergyUsage.user_id == current_user.id, 
-        EnergyUsage.energy_type == 'water'
-    ).scalar() or 0  # Default to 0 if no records are found
+    # Average units used for water and electricity, from the daily rollup
+    average_electricity = round(rollup.average(current_user.id, 'electricity'))
+    average_water = round(rollup.average(current_user.id, 'water'))
     return render_template('Users/user_dashboard.html', most_recent_recommendation=most_recent_recommendation, average_electricity=average_electricity, average_water=average_water)
 
 @routes_bp.route('/users/data_entry', methods=['GET', 'POST'])
@@ -51,17 +54,26 @@ def data_entry():
         units_used = request.form.get('unitsUsed')
         date_recorded = request.form.get('date')
 
-        new_usage = EnergyUsage(
-            user_id=current_user.id,
-            energy_type=energy_type,
-            units_used=units_used,
-            date_recorded=datetime.strptime(date_recorded, '%Y-%m-%d')
-        )
+        # Same energy types as bulk ingest accepts; anything else would be stored as a new type
+        if energy_type not in ingest.ENERGY_TYPES:
+            flash(f"Unknown energy type. Choose one of: {', '.join(ingest.ENERGY_TYPES)}.", 'error')
+            return redirect(url_for('routes.data_entry'))
 
-        # Add to the session and commit
-        db.session.add(new_usage)
         try:
-            db.session.commit()
+            reading = {
+                'user_id': current_user.id,
+                'energy_type': energy_type,
+                'units_used': float(units_used),
+                'date_recorded': datetime.strptime(date_recorded, '%Y-%m-%d')
+            }
+            if write_behind.enabled():
+                # Queued; the background writer group-commits it with other submissions
+                write_behind.submit(reading)
+            else:
+                # Add to the session, update the daily rollup in the same transaction and commit
+                db.session.add(EnergyUsage(**reading))
+                rollup.add_readings([(reading['user_id'], reading['energy_type'], reading['date_recorded'], reading['units_used'])])
+                db.session.commit()
             flash('Energy usage recorded successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -74,53 +86,133 @@ def data_entry():
     return render_template('Users/data_entry.html')
 
 from flask import request
-from sqlalchemy import func
 from datetime import datetime, timedelta
 
+# Preset history periods in days; 'custom' reads start and end (YYYY-MM-DD) from the query string
+HISTORY_PERIODS = {'7 days': 7, '30 days': 30, '3 months': 90, '6 months': 180, '1 year': 365, '5 years': 1826}
+
+def _history_range():
+    # (time_period, start_date, end_day) for the history pages; end_day is None for the presets.
+    # Unknown periods and malformed custom ranges fall back to the last 7 days.
+    time_period = request.args.get('time_period', '7 days')
+    if time_period == 'custom':
+        try:
+            start_day = date.fromisoformat(request.args.get('start', ''))
+            # No reading is recorded after today; capping the end also keeps end_day + 1 day in range
+            end_day = min(date.fromisoformat(request.args['end']), date.today()) if request.args.get('end') \
+                else date.today()
+        except ValueError:
+            start_day = end_day = None
+        if start_day is not None and start_day <= end_day:
+            return time_period, datetime.combine(start_day, datetime.min.time()), end_day
+    if time_period not in HISTORY_PERIODS:
+        time_period = '7 days'
+    return time_period, datetime.now() - timedelta(days=HISTORY_PERIODS[time_period]), None
+
+def _history_page_size():
+    # Rows per history page as requested, kept between 1 and HISTORY_MAX_PAGE_SIZE
+    page_size = request.args.get('page_size', current_app.config['HISTORY_PAGE_SIZE'], type=int)
+    return max(min(page_size, current_app.config['HISTORY_MAX_PAGE_SIZE']), 1)
+
+def _history_page(user_id, energy_type, start_date, end_day, page_size):
+    # One keyset page of a user's readings, newest first, driven by the after/before cursors
+    end_date = datetime.combine(end_day + timedelta(days=1), datetime.min.time()) if end_day is not None else None
+    query = EnergyUsage.query.filter(EnergyUsage.user_id == user_id,
+                                     EnergyUsage.energy_type == energy_type,
+                                     EnergyUsage.date_recorded >= start_date)
+    if end_date is not None:
+        query = query.filter(EnergyUsage.date_recorded < end_date)
+    # Archived readings are paged together with the hot rows
+    return archive.keyset_page(query, user_id, energy_type, start_date, end_date, page_size,
+                               after=pagination.decode_cursor(request.args.get('after')),
+                               before=pagination.decode_cursor(request.args.get('before')))
+
 @routes_bp.route('/users/history')
 @login_required
 def history():
     if current_user.is_admin:
         return redirect(url_for('routes.admin_dashboard'))
 
+    # Show readings this user just submitted through the write-behind queue
+    write_behind.wait_for_user(current_user.id)
+
     # Get the selected time period, aggregation, and energy type from the dropdown menus
-    time_period = request.args.get('time_period', '7 days')  # Default to last 7 days
+    time_period, start_date, end_day = _history_range()
     energy_type = request.args.get('energy_type', 'electricity')  # Default to electricity
     
-    # Adjust the query based on the selected time period and energy type
-    if time_period == '7 days':
-        start_date = datetime.now() - timedelta(days=7)
-    elif time_period == '30 days':
-        start_date = datetime.now() - timedelta(days=30)
-    elif time_period == '3 months':
-        start_date = datetime.now() - timedelta(days=90)  # Assuming 3 months = 90 days
-    elif time_period == '6 months':
-        start_date = datetime.now() - timedelta(days=180)  # Assuming 6 months = 180 days
-    
-    # Filter the records based on time period and energy type
-    records = EnergyUsage.query.filter(EnergyUsage.user_id == current_user.id,
-                                       EnergyUsage.energy_type == energy_type,
-                                       EnergyUsage.date_recorded >= start_date).all()
-    
     # Get the value of the aggregation parameter
     aggregation = request.args.get('aggregate', 'all')  # Default to all records
+    chart_url = None
+    page_size = _history_page_size()
     
     if aggregation == 'aggregate':
-        # Calculate the total units used and average units used
-        total_units_used = sum(record.units_used for record in records)
-        average_units_used = total_units_used / len(records) if records else 0
-        records = None  # Reset records to None since we're showing aggregates
+        # Calculate the total units used and average units used in the database
+        total_units_used, count = binning.usage_totals(current_user.id, energy_type, start_date, end_day)
+        average_units_used = total_units_used / count if count else 0
+        records = None  # No records since we're showing aggregates
+        next_cursor = prev_cursor = None
         show_aggregate = True
+    elif aggregation == 'chart':
+        # The page draws a downsampled chart from /api/usage/history
+        chart_url = url_for('routes.usage_history', energy_type=energy_type, start=start_date.date().isoformat(),
+                            end=(end_day or date.today()).isoformat())
+        records = total_units_used = average_units_used = None
+        next_cursor = prev_cursor = None
+        show_aggregate = False
     else:
+        # One page of records for the time period and energy type
+        records, next_cursor, prev_cursor = _history_page(current_user.id, energy_type, start_date, end_day, page_size)
         total_units_used = None
         average_units_used = None
         show_aggregate = False
     
-    return render_template('Users/history.html', records=records, time_period=time_period,
-                           total_units_used=total_units_used, average_units_used=average_units_used,
-                           aggregation=aggregation, show_aggregate=show_aggregate)
+    # Stream the page so the first bytes go out before the whole table is rendered
+    return stream_template('Users/history.html', records=records, time_period=time_period,
+                           energy_type=energy_type, total_units_used=total_units_used,
+                           average_units_used=average_units_used, aggregation=aggregation,
+                           show_aggregate=show_aggregate, next_cursor=next_cursor, prev_cursor=prev_cursor,
+                           page_size=page_size,
+                           start=request.args.get('start') if time_period == 'custom' else None,
+                           end=request.args.get('end') if time_period == 'custom' else None, chart_url=chart_url)
+
+import charts
+import graph_cache
+
+def _power_usage_graphs(user_id, energy_types, weeks=10):
+    # Render jobs for a user's server-side graphs, keyed by cache filename, per energy type with data:
+    # weekly totals for the last `weeks` weeks and daily usage for the last 21 days
+    end_day = date.today()
+    start_day = end_day - timedelta(days=weeks * 7 - 1)
+    days = binning.day_range(start_day, end_day)
+    daily = binning.daily_usage(user_id, start_day, end_day, energy_types)
+
+    graphs = {}
+    for energy_type in energy_types:
+        if energy_type not in daily:
+            continue
 
-import os
+        # Each weekly bucket is labelled with its last day
+        weekly_dates = [day.strftime('%Y-%m-%d') for day in days[6::7]]
+        weekly_usage = binning.weekly_totals(daily[energy_type], weeks).tolist()
+        all_time_dates = [day.strftime('%Y-%m-%d') for day in days[-21:]]
+        all_time_usage = daily[energy_type][-21:].tolist()
+
+        graphs[energy_type] = {
+            graph_cache.graph_filename(user_id, energy_type, 'bar', weekly_dates, weekly_usage):
+                ('bar', f'Weekly {energy_type.capitalize()} Usage', weekly_dates, weekly_usage),
+            graph_cache.graph_filename(user_id, energy_type, 'line', all_time_dates, all_time_usage):
+                ('line', f'All-Time {energy_type.capitalize()} Usage', all_time_dates, all_time_usage),
+        }
+    return graphs
+
+def _render_graphs(render_jobs, keep):
+    # Render the jobs concurrently in the worker pool, store them and trim the cache around `keep`
+    with metrics.timed('chart'):
+        rendered = charts.render_many(render_jobs, current_app.config['CHART_RENDER_WORKERS'])
+    for filename, png in rendered.items():
+        graph_cache.store(filename, png)
+    graph_cache.evict(keep=keep)
+    return rendered
 
 @routes_bp.route('/users/power_usage')
 @login_required
@@ -130,110 +222,149 @@ def power_usage():
 
     energy_types = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
     latest_graphs = {}
-
+    render_jobs = {}
+
+    if current_app.config['CHART_RENDERING'] == 'client':
+        # The page fetches both series from the JSON API and draws the charts itself
+        weeks = 10
+        end_day = date.today()
+        start_day = end_day - timedelta(days=weeks * 7 - 1)
+        weekly_url = url_for('routes.usage_series', interval='weekly', start=start_day.isoformat(), end=end_day.isoformat())
+        daily_url = url_for('routes.usage_series', interval='daily', start=(end_day - timedelta(days=20)).isoformat(),
+                            end=end_day.isoformat())
+        return render_template('Users/power_usage.html', latest_graphs=None,
+                               energy_types=series.energy_types_with_data(current_user.id, start_day, end_day),
+                               weekly_url=weekly_url, daily_url=daily_url)
+
+    graphs = _power_usage_graphs(current_user.id, energy_types)
     for energy_type in energy_types:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(weeks=10)
-        energy_data = EnergyUsage.query.filter(
-            EnergyUsage.user_id == current_user.id,
-            EnergyUsage.energy_type == energy_type,
-            EnergyUsage.date_recorded >= start_date,
-            EnergyUsage.date_recorded <= end_date
-        ).all()
-
-        if not energy_data:
+        if energy_type not in graphs:
             latest_graphs[energy_type] = {'bar_graph_exists': False, 'line_graph_exists': False}
             continue
 
-        weekly_dates = [(end_date - timedelta(weeks=i)).strftime('%Y-%m-%d') for i in range(10)]
-        weekly_usage = [sum(data.units_used for data in energy_data if data.date_recorded.strftime('%Y-%m-%d') == date) for date in weekly_dates]
-        all_time_dates = [(end_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(21)]
-        all_time_usage = [sum(data.units_used for data in energy_data if data.date_recorded.strftime('%Y-%m-%d') == date) for date in all_time_dates]
-
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        bar_graph_filename = f'{energy_type}_bar_graph_{timestamp}.png'
-        line_graph_filename = f'{energy_type}_line_graph_{timestamp}.png'
-
-        # Save bar graph
-        bar_graph_path = os.path.join(current_app.root_path, 'static', 'Images', bar_graph_filename)
-        plt.figure(figsize=(10, 6))
-        plt.bar(weekly_dates, weekly_usage)
-        plt.xlabel('Date')
-        plt.ylabel('Energy Usage')
-        plt.title(f'Weekly {energy_type.capitalize()} Usage')
-        plt.xticks(rotation=45)
-        plt.savefig(bar_graph_path, format='png')
-        plt.close()
-
-        # Save line graph
-        line_graph_path = os.path.join(current_app.root_path, 'static', 'Images', line_graph_filename)
-        plt.figure(figsize=(10, 6))
-        plt.plot(all_time_dates, all_time_usage, marker='o')
-        plt.xlabel('Date')
-        plt.ylabel('Energy Usage')
-        plt.title(f'All-Time {energy_type.capitalize()} Usage')
-        plt.xticks(rotation=45)
-        plt.savefig(line_graph_path, format='png')
-        plt.close()
+        # Queue graphs that are not already cached; they are rendered together below
+        for filename, job in graphs[energy_type].items():
+            if not graph_cache.contains(filename):
+                render_jobs[filename] = job
 
         # Store the latest file names
+        bar_graph_filename, line_graph_filename = graphs[energy_type]
         latest_graphs[energy_type] = {
             'bar_graph_exists': True, 'bar_graph_filename': bar_graph_filename,
             'line_graph_exists': True, 'line_graph_filename': line_graph_filename
         }
 
+    if render_jobs:
+        _render_graphs(render_jobs, keep={filename for filenames in graphs.values() for filename in filenames})
+
     return render_template('Users/power_usage.html', latest_graphs=latest_graphs)
 
+@routes_bp.route('/users/power_usage/graphs/<filename>')
+@login_required
+def power_usage_graph(filename):
+    # Users may only fetch graphs rendered from their own data
+    if graph_cache.graph_owner(filename) != current_user.id:
+        abort(404)
+
+    png = graph_cache.load(filename)
+    if png is None:
+        # Evicted (or rendered by another host) since the page was served: draw it again if it still
+        # matches the user's data, otherwise the page is out of date
+        energy_type = filename.split('_', 1)[0]
+        render_job = _power_usage_graphs(current_user.id, [energy_type]).get(energy_type, {}).get(filename)
+        if render_job is None:
+            abort(404)
+        png = _render_graphs({filename: render_job}, keep={filename})[filename]
+
+    response = Response(png, mimetype='image/png')
+    # The filename is a hash of the plotted data, so its content never changes
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['GRAPH_CACHE_MAX_AGE']
+    return response
+
+@routes_bp.route('/api/usage/series')
+@login_required
+def usage_series():
+    # Binned usage for charts and API clients. Admins may ask for any user_id.
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    if user_id != current_user.id and not user_cache.confirm_admin(current_user):
+        abort(403)
+    interval = request.args.get('interval', 'daily')
+    if interval not in series.INTERVALS:
+        return jsonify({'error': f"interval must be one of {', '.join(series.INTERVALS)}"}), 400
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    try:
+        start, end = series.window(interval, start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    energy_types = request.args.getlist('energy_type')
+
+    version = series.data_version(user_id)
+    if version is None:
+        abort(404)
+    # The ETag changes whenever the user's readings do, so repeat polls are answered with a 304
+    etag = series.etag(user_id, version, interval, start, end, energy_types)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(series.usage_series(user_id, interval, start, end, energy_types))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@routes_bp.route('/api/usage/history')
+@login_required
+def usage_history():
+    # One energy type's readings over any date range, downsampled to a fixed number of points.
+    # Admins may ask for any user_id.
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    if user_id != current_user.id and not user_cache.confirm_admin(current_user):
+        abort(403)
+    energy_type = request.args.get('energy_type', 'electricity')
+    method = request.args.get('method', current_app.config['HISTORY_CHART_METHOD'])
+    if method not in downsample.METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(downsample.METHODS)}"}), 400
+    points = min(request.args.get('points', current_app.config['HISTORY_CHART_POINTS'], type=int),
+                 current_app.config['HISTORY_CHART_MAX_POINTS'])
+    try:
+        # Capped at today, as in _history_range
+        end = min(date.fromisoformat(request.args['end']), date.today()) if request.args.get('end') else date.today()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=364)
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+
+    version = series.data_version(user_id)
+    if version is None:
+        abort(404)
+    etag = series.etag(user_id, version, f'{method}:{points}', start, end, [energy_type])
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(downsample.usage_points(user_id, energy_type, start, end, max(points, 4), method))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @routes_bp.route('/users/recommendations')
 @login_required
 def recommendations():
     if current_user.is_admin:
         return redirect(url_for('routes.admin_dashboard'))
     
-    # Define energy types
-    energy_types = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    latest_recommendations = []
-
-    for energy_type in energy_types:
-        energy_data = EnergyUsage.query.filter(
-            EnergyUsage.user_id == current_user.id,
-            EnergyUsage.energy_type == energy_type,
-            EnergyUsage.date_recorded >= start_date,
-            EnergyUsage.date_recorded <= end_date
-        ).order_by(EnergyUsage.date_recorded.desc()).all()
-
-        if not energy_data:
-            continue
-
-        # Find the latest date for current energy type data
-        latest_date = max(data.date_recorded for data in energy_data)
-
-        usage_values = [data.units_used for data in energy_data if data.date_recorded == latest_date]
-        first_quartile = np.percentile(usage_values, 25)
-        third_quartile = np.percentile(usage_values, 75)
-        max_usage = max(usage_values)
-
-        for data in energy_data:
-            if data.date_recorded == latest_date:
-                if data.units_used < first_quartile:
-                    recommendation = "Congratulations! Your energy usage is below average."
-                elif data.units_used > third_quartile:
-                    recommendation = "Consider reducing energy usage. Your usage is higher than usual."
-                elif data.units_used == max_usage:
-                    recommendation = "Warning! Your energy usage today is the highest recorded in the past week."
-                else:
-                    recommendation = "No specific recommendation for today. Continue to monitor energy usage."
-
-                db_recommendation = Recommendations(user_id=current_user.id, recommendation=recommendation, date_recorded=data.date_recorded, energy_type=energy_type)
-                db.session.add(db_recommendation)
-                
-                latest_recommendations.append((data.date_recorded, energy_type, recommendation))
-
-    db.session.commit()
-    return render_template('Users/recommendations.html', all_recommendations=latest_recommendations)
+    # Recommendations are computed by the batch job (flask generate-recommendations)
+    latest_recommendations = recommender.recent(current_user.id)
+    # The user's average reading placed within the fleet's distribution (precomputed sketches)
+    fleet_comparison = sketches.user_comparison(current_user.id, series.ENERGY_TYPES)
+    return render_template('Users/recommendations.html', all_recommendations=latest_recommendations,
+                           fleet_comparison=fleet_comparison)
 @routes_bp.route('/users/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
@@ -249,27 +380,32 @@ def settings():
         new_password = request.form.get('newPassword')
         confirm_password = request.form.get('confirmPassword')
 
+        # current_user is a cached snapshot; load the real row to check and change it
+        user = db.session.get(User, current_user.id)
+
         # Check if current password matches the user's password
-        if not current_user.check_password(current_password):
+        if not user.check_password(current_password):
             flash('Incorrect current password. Please try again.', 'error')
             return redirect(url_for('routes.settings'))
 
         # Update user details if provided
         if firstname:
-            current_user.firstname = firstname
+            user.firstname = firstname
         if lastname:
-            current_user.lastname = lastname
+            user.lastname = lastname
         if email:
-            current_user.email = email
+            user.email = email
 
         # Change password if new password is provided and matches the confirm password
         if new_password and new_password == confirm_password:
-            current_user.set_password(new_password)
+            user.set_password(new_password)
 
-        # Commit changes to the database
+        # Commit changes to the database and drop the stale snapshot
         db.session.commit()
+        user_cache.invalidate(user.id)
 
         flash('Your settings have been updated successfully.', 'success')
+        return redirect(url_for('routes.settings'))
 
     return render_template('Users/settings.html')
 
@@ -277,32 +413,118 @@ def settings():
 @routes_bp.route('/admin/dashboard')
 @login_required
 def admin_dashboard():
-    if not current_user.is_admin:
+    if not user_cache.confirm_admin(current_user):
         return redirect(url_for('routes.user_dashboard'))
 
-    # Calculate average units used for electricity and water
-    average_electricity = db.session.query(func.round(func.avg(EnergyUsage.units_used))).filter_by(energy_type='electricity').scalar() or 0
-    average_water = db.session.query(func.round(func.avg(EnergyUsage.units_used))).filter_by(energy_type='water').scalar() or 0
+    # Fleet-wide stats per energy type, cached and invalidated by usage writes
+    fleet_stats = stats_cache.fleet_stats()
+    # Reading distribution per energy type, from the precomputed quantile sketches
+    fleet_quantiles = {energy_type: sketches.fleet_quantiles(energy_type) for energy_type in fleet_stats}
+    average_electricity = round(fleet_stats.get('electricity', {}).get('average', 0))
+    average_water = round(fleet_stats.get('water', {}).get('average', 0))
 
-    return render_template('Admin/admin_dashboard.html',
+    return render_template('Admin/Admin_dashboard.html',
                            average_electricity=average_electricity,
-                           average_water=average_water)
+                           average_water=average_water,
+                           fleet_stats=fleet_stats, fleet_quantiles=fleet_quantiles)
 
 @routes_bp.route('/admin/users')
 @login_required
 def admin_users():
-    if not current_user.is_admin:
+    if not user_cache.confirm_admin(current_user):
+        return redirect(url_for('routes.user_dashboard'))
+
+    # Server-side pagination, search and sorting over users and their usage summaries
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['ADMIN_USERS_PAGE_SIZE']
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'name')
+    if sort not in user_directory.SORT_KEYS:
+        sort = 'name'
+    descending = request.args.get('order') == 'desc'
+
+    rows, total_users = user_directory.directory_page(page, per_page, search, sort, descending)
+    pages = max((total_users + per_page - 1) // per_page, 1)
+    return render_template('Admin/Users.html', rows=rows, energy_types=user_directory.ENERGY_TYPES,
+                           page=page, pages=pages, total_users=total_users,
+                           search=search, sort=sort, descending=descending)
+
+
+@routes_bp.route('/admin/user_cache')
+@login_required
+def admin_user_cache():
+    if not user_cache.confirm_admin(current_user):
+        return redirect(url_for('routes.user_dashboard'))
+
+    # Hit/miss counters of this worker's user_loader cache
+    return jsonify(user_cache.stats())
+
+
+@routes_bp.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not user_cache.confirm_admin(current_user):
+        return redirect(url_for('routes.user_dashboard'))
+
+    # This worker's request, SQL and render histograms; ?format=prometheus for the text exposition format
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+    return jsonify(metrics.snapshot())
+
+
+@routes_bp.route('/admin/ingest', methods=['POST'])
+@login_required
+def admin_ingest():
+    if not user_cache.confirm_admin(current_user):
+        return redirect(url_for('routes.user_dashboard'))
+
+    # Accept a multipart upload ('file') or the raw request body; both are read as a stream
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or ingest.guess_format(upload.filename)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or ('jsonl' if 'json' in (request.mimetype or '') else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': f'unsupported format: {fmt}'}), 400
+
+    batch_size = request.args.get('batch_size', type=int)
+    result = ingest.ingest_stream(stream, fmt, batch_size)
+    # A file that could not be read to the end is a bad request; the summary says what was committed
+    return jsonify(result), 400 if 'error' in result else 200
+
+
+@routes_bp.route('/admin/export')
+@login_required
+def admin_export():
+    if not user_cache.confirm_admin(current_user):
         return redirect(url_for('routes.user_dashboard'))
 
-    all_users = User.query.all()
-    return render_template('Admin/users.html', all_users=all_users)
+    # Filters: repeatable user_id and energy_type, start/end days, format and gzip
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': f'unsupported format: {fmt}'}), 400
+    try:
+        start = export.parse_day(request.args.get('start'))
+        end = export.parse_day(request.args.get('end'), end=True)
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+
+    rows = export.iter_readings(request.args.getlist('user_id', type=int), request.args.getlist('energy_type'), start, end)
+    body = export.encode(export.iter_export(rows, fmt), compress)
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{export.filename(fmt, compress)}"'
+    return response
 
 
 @routes_bp.route('/Admin/history/<int:user_id>')
 @login_required
 def history_user(user_id):
     # Check if the current user is an admin
-    if not current_user.is_admin:
+    if not user_cache.confirm_admin(current_user):
         return redirect(url_for('routes.admin_dashboard'))
 
     # Fetch the user whose history is to be viewed
@@ -311,35 +533,32 @@ def history_user(user_id):
         return "User not found", 404
 
     # Extract query parameters
-    time_period = request.args.get('time_period', '7 days')  # Default to last 7 days
+    time_period, start_date, end_day = _history_range()
     energy_type = request.args.get('energy_type', 'electricity')  # Default to electricity
     aggregation = request.args.get('aggregate', 'all')  # Default to all records
+    chart_url = None
+    page_size = _history_page_size()
 
-    # Compute start date based on the time period
-    if time_period == '7 days':
-        start_date = datetime.now() - timedelta(days=7)
-    elif time_period == '30 days':
-        start_date = datetime.now() - timedelta(days=30)
-    elif time_period == '3 months':
-        start_date = datetime.now() - timedelta(days=90)
-    elif time_period == '6 months':
-        start_date = datetime.now() - timedelta(days=180)
-
-    # Query the energy usage records
-    records = EnergyUsage.query.filter(EnergyUsage.user_id == user.id,
-                                       EnergyUsage.energy_type == energy_type,
-                                       EnergyUsage.date_recorded >= start_date).all()
-
-    # Compute aggregates if needed
+    # Compute aggregates in the database if needed, otherwise query the records
     if aggregation == 'aggregate':
-        total_units_used = sum(record.units_used for record in records)
-        average_units_used = total_units_used / len(records) if records else 0
-        records = None  # Optional: Clear records if only showing aggregates
+        total_units_used, count = binning.usage_totals(user.id, energy_type, start_date, end_day)
+        average_units_used = total_units_used / count if count else 0
+        records = None  # Optional: No records if only showing aggregates
+        next_cursor = prev_cursor = None
+    elif aggregation == 'chart':
+        chart_url = url_for('routes.usage_history', user_id=user.id, energy_type=energy_type,
+                            start=start_date.date().isoformat(), end=(end_day or date.today()).isoformat())
+        records = total_units_used = average_units_used = None
+        next_cursor = prev_cursor = None
     else:
+        records, next_cursor, prev_cursor = _history_page(user.id, energy_type, start_date, end_day, page_size)
         total_units_used = None
         average_units_used = None
 
     # Render the template with the user's data
-    return render_template('Admin/history.html', records=records, time_period=time_period,
-                           total_units_used=total_units_used, average_units_used=average_units_used,
-                           aggregation=aggregation, user=user)
\ No newline at end of file
+    return stream_template('Admin/history.html', records=records, time_period=time_period,
+                           energy_type=energy_type, total_units_used=total_units_used,
+                           average_units_used=average_units_used, aggregation=aggregation, user=user,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor, page_size=page_size,
+                           start=request.args.get('start') if time_period == 'custom' else None,
+                           end=request.args.get('end') if time_period == 'custom' else None, chart_url=chart_url)
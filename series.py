@@ -0,0 +1,129 @@
+# series.py
+import hashlib
+from datetime import date, timedelta
+from sqlalchemy import func, cast, Integer
+from models import User, DailyUsage
+from __init__ import db
+
+ENERGY_TYPES = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
+INTERVALS = ('daily', 'weekly', 'monthly')
+DEFAULT_BINS = {'daily': 30, 'weekly': 12, 'monthly': 12}  # Bins returned when no start is given
+MAX_BINS = 3660
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _add_months(day, months):
+    years, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + years, month + 1, 1)
+
+
+def window(interval, start=None, end=None):
+    # Widen [start, end] to whole bins: weekly bins end on `end`, monthly bins are calendar months
+    end = end or date.today()
+    if interval == 'daily':
+        start = start or end - timedelta(days=DEFAULT_BINS['daily'] - 1)
+    elif interval == 'weekly':
+        weeks = -(-((end - start).days + 1) // 7) if start else DEFAULT_BINS['weekly']
+        start = end - timedelta(days=weeks * 7 - 1)
+    else:
+        start = _month_start(start) if start else _add_months(end, 1 - DEFAULT_BINS['monthly'])
+    if start > end:
+        raise ValueError('start must not be after end')
+    if len(labels(interval, start, end)) > MAX_BINS:
+        raise ValueError(f'at most {MAX_BINS} bins per request')
+    return start, end
+
+
+def labels(interval, start, end):
+    # First day of every bin ('YYYY-MM' for months)
+    if interval == 'monthly':
+        result = []
+        month = _month_start(start)
+        while month <= end:
+            result.append(month.strftime('%Y-%m'))
+            month = _add_months(month, 1)
+        return result
+    step = 1 if interval == 'daily' else 7
+    return [(start + timedelta(days=offset)).isoformat() for offset in range(0, (end - start).days + 1, step)]
+
+
+def _bucket(interval, start, dialect):
+    # SQL expression for a row's bin, or None to group by day and fold the days into bins here
+    if interval == 'daily':
+        return DailyUsage.day
+    if dialect == 'sqlite':
+        if interval == 'weekly':
+            return cast((func.julianday(DailyUsage.day) - func.julianday(start)) / 7, Integer)
+        return func.strftime('%Y-%m', DailyUsage.day)
+    if dialect == 'postgresql':
+        if interval == 'weekly':
+            return (DailyUsage.day - start) / 7  # date - date is a number of days
+        return func.to_char(DailyUsage.day, 'YYYY-MM')
+    return None
+
+
+def _label(interval, start, key, grouped, bin_labels):
+    if interval == 'daily' or not grouped:
+        day = key if isinstance(key, date) else date.fromisoformat(key)
+        if interval == 'daily':
+            return day.isoformat()
+        if interval == 'monthly':
+            return day.strftime('%Y-%m')
+        key = (day - start).days // 7
+    return bin_labels[int(key)] if interval == 'weekly' else str(key)
+
+
+def usage_series(user_id, interval, start, end, energy_types=None):
+    # Binned totals from the daily rollup, one grouped query over the (user, type, day) primary key.
+    # Energy types without readings in the window are left out.
+    bin_labels = labels(interval, start, end)
+    positions = {label: index for index, label in enumerate(bin_labels)}
+    bucket = _bucket(interval, start, db.session.get_bind().dialect.name)
+    grouped = bucket is not None
+    if not grouped:
+        bucket = DailyUsage.day
+
+    rows = db.session.query(
+        DailyUsage.energy_type, bucket, func.sum(DailyUsage.units_total), func.sum(DailyUsage.reading_count)
+    ).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.energy_type.in_(energy_types or ENERGY_TYPES),
+        DailyUsage.day >= start,
+        DailyUsage.day <= end
+    ).group_by(DailyUsage.energy_type, bucket).all()
+
+    series = {}
+    for energy_type, key, total, readings in rows:
+        values = series.setdefault(energy_type, {'total': [0.0] * len(bin_labels), 'readings': [0] * len(bin_labels)})
+        index = positions[_label(interval, start, key, grouped, bin_labels)]
+        values['total'][index] += total or 0.0
+        values['readings'][index] += readings or 0
+    for values in series.values():
+        values['total'] = [round(total, 3) for total in values['total']]
+
+    ordered = [energy_type for energy_type in ENERGY_TYPES if energy_type in series] + \
+        sorted(energy_type for energy_type in series if energy_type not in ENERGY_TYPES)
+    return {'user_id': user_id, 'interval': interval, 'start': start.isoformat(), 'end': end.isoformat(),
+            'labels': bin_labels, 'series': {energy_type: series[energy_type] for energy_type in ordered}}
+
+
+def energy_types_with_data(user_id, start, end):
+    found = {energy_type for energy_type, in db.session.query(DailyUsage.energy_type).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.day >= start,
+        DailyUsage.day <= end
+    ).distinct()}
+    return [energy_type for energy_type in ENERGY_TYPES if energy_type in found]
+
+
+def data_version(user_id):
+    # Bumped by rollup.py whenever the user's readings change; None for unknown users
+    return db.session.query(User.usage_version).filter(User.id == user_id).scalar()
+
+
+def etag(user_id, version, interval, start, end, energy_types):
+    key = f'{user_id}|{version}|{interval}|{start}|{end}|{",".join(sorted(energy_types or ENERGY_TYPES))}'
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
@@ -0,0 +1,283 @@
+# sketches.py
+import bisect
+import itertools
+import math
+import os
+import struct
+import threading
+from datetime import date
+import click
+from flask import current_app
+from sqlalchemy import func, delete
+from models import DailyUsage, EnergyUsage, UsageSketch
+from __init__ import db
+import stats_cache
+import archive
+
+COMPRESSION = 100  # t-digest δ: at most about δ/2 centroids (~51 at 100), quantile error around 1% in the middle, far less in the tails
+BUFFER_FACTOR = 5  # Values buffered before a merge pass, as a multiple of COMPRESSION
+REBUILD_YIELD_PER = 10000
+
+
+class TDigest:
+    # Merging t-digest (Dunning & Ertl): a sorted list of (mean, weight) centroids whose size
+    # is bounded by the k1 scale function. Digests merge by pooling their centroids.
+
+    def __init__(self, centroids=None, minimum=math.inf, maximum=-math.inf):
+        self.centroids = centroids or []
+        self.min = minimum
+        self.max = maximum
+        self._buffer = []
+
+    @property
+    def count(self):
+        self._compress()
+        return sum(weight for _, weight in self.centroids)
+
+    def update(self, values):
+        for value in values:
+            self._buffer.append((value, 1.0))
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+        if len(self._buffer) > BUFFER_FACTOR * COMPRESSION:
+            self._compress()
+        return self
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend(other.centroids)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @staticmethod
+    def _k(q):
+        return COMPRESSION / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = []
+        mean, weight = points[0]
+        weight_before = 0.0
+        k_left = self._k(0.0)
+        for point_mean, point_weight in points[1:]:
+            if self._k(min((weight_before + weight + point_weight) / total, 1.0)) - k_left <= 1:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                weight_before += weight
+                k_left = self._k(weight_before / total)
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def _centers(self):
+        # Cumulative weight at the middle of each centroid
+        centers = []
+        cumulative = 0.0
+        for _, weight in self.centroids:
+            centers.append(cumulative + weight / 2)
+            cumulative += weight
+        return centers, cumulative
+
+    def quantile(self, q):
+        self._compress()
+        if not self.centroids:
+            return None
+        centers, total = self._centers()
+        target = q * total
+        means = [mean for mean, _ in self.centroids]
+        if target <= centers[0]:
+            return self.min + (means[0] - self.min) * (target / centers[0] if centers[0] else 0)
+        if target >= centers[-1]:
+            tail = total - centers[-1]
+            return means[-1] + (self.max - means[-1]) * ((target - centers[-1]) / tail if tail else 0)
+        i = bisect.bisect_right(centers, target) - 1
+        fraction = (target - centers[i]) / (centers[i + 1] - centers[i])
+        return means[i] + (means[i + 1] - means[i]) * fraction
+
+    def cdf(self, value):
+        # Fraction of the recorded values at or below value
+        self._compress()
+        if not self.centroids or value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+        centers, total = self._centers()
+        means = [mean for mean, _ in self.centroids]
+        if value <= means[0]:
+            span = means[0] - self.min
+            return (centers[0] * ((value - self.min) / span if span else 1)) / total
+        if value >= means[-1]:
+            span = self.max - means[-1]
+            return (centers[-1] + (total - centers[-1]) * ((value - means[-1]) / span if span else 0)) / total
+        i = bisect.bisect_right(means, value) - 1
+        span = means[i + 1] - means[i]
+        fraction = (value - means[i]) / span if span else 0.5
+        return (centers[i] + (centers[i + 1] - centers[i]) * fraction) / total
+
+    def to_bytes(self):
+        self._compress()
+        flat = [number for centroid in self.centroids for number in centroid]
+        return struct.pack(f'<ddI{len(flat)}d', self.min, self.max, len(self.centroids), *flat)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        minimum, maximum, size = struct.unpack_from('<ddI', data)
+        flat = struct.unpack_from(f'<{size * 2}d', data, struct.calcsize('<ddI'))
+        return cls(list(zip(flat[0::2], flat[1::2])), minimum, maximum)
+
+
+def period(value):
+    # Sketches are kept per energy type and calendar month
+    return value.strftime('%Y-%m')
+
+
+def _months_back(day, months):
+    # The first day of the month `months` before day's month
+    years, month = divmod(day.month - 1 - months, 12)
+    return date(day.year + years, month + 1, 1)
+
+
+def _shard():
+    # The sketch row this thread writes to. Concurrent writers of the same energy type and month mostly
+    # land on different rows, so they do not queue behind one row lock; fleet_digest merges all shards.
+    return hash((os.getpid(), threading.get_ident())) % current_app.config['SKETCH_SHARDS']
+
+
+def _locked_rows(keys):
+    # Existing sketch rows for (energy_type, period, shard) keys, creating missing ones; rows are locked
+    # where the backend supports it so writers sharing a shard merge one after another
+    dialect = db.session.get_bind().dialect.name
+    values = [{'energy_type': energy_type, 'period': key_period, 'shard': shard, 'reading_count': 0, 'digest': b''}
+              for energy_type, key_period, shard in keys]
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        db.session.execute(upsert(UsageSketch).on_conflict_do_nothing(), values)
+        return {key: db.session.get(UsageSketch, key, with_for_update=True) for key in keys}
+
+    rows = {}
+    for value in values:
+        key = (value['energy_type'], value['period'], value['shard'])
+        rows[key] = db.session.get(UsageSketch, key, with_for_update=True)
+        if rows[key] is None:
+            rows[key] = UsageSketch(**value)
+            db.session.add(rows[key])
+    return rows
+
+
+def add_readings(readings):
+    # Fold (user_id, energy_type, date_recorded, units_used) readings into this writer's shard of the
+    # monthly sketches, in the caller's transaction (called from rollup.add_readings)
+    shard = _shard()
+    groups = {}
+    for _, energy_type, date_recorded, units_used in readings:
+        if energy_type is None or date_recorded is None or units_used is None:
+            continue
+        groups.setdefault((energy_type, period(date_recorded), shard), []).append(float(units_used))
+    if not groups:
+        return
+
+    for key, row in _locked_rows(sorted(groups)).items():
+        digest = TDigest.from_bytes(row.digest).update(groups[key])
+        row.digest = digest.to_bytes()
+        row.reading_count = (row.reading_count or 0) + len(groups[key])
+
+
+def rebuild():
+    # Recompute every sketch from EnergyUsage and the archive in one streaming pass (no ORDER BY, so no sort).
+    # Each month ends up in a single row (shard 0), which also folds the writers' shards back together.
+    digests = {}
+    query = db.session.query(EnergyUsage.energy_type, EnergyUsage.date_recorded, EnergyUsage.units_used).filter(
+        EnergyUsage.energy_type.is_not(None), EnergyUsage.date_recorded.is_not(None),
+        EnergyUsage.units_used.is_not(None)
+    ).execution_options(stream_results=True, yield_per=REBUILD_YIELD_PER)
+    cold = ((row.energy_type, row.date_recorded, row.units_used) for row in archive.iter_rows() if row.units_used is not None)
+    pending = {}
+    counts = {}
+    for energy_type, date_recorded, units_used in itertools.chain(query, cold):
+        key = (energy_type, period(date_recorded))
+        values = pending.setdefault(key, [])
+        values.append(float(units_used))
+        if len(values) >= REBUILD_YIELD_PER:
+            digests.setdefault(key, TDigest()).update(values)
+            counts[key] = counts.get(key, 0) + len(values)
+            pending[key] = []
+    for key, values in pending.items():
+        digests.setdefault(key, TDigest()).update(values)
+        counts[key] = counts.get(key, 0) + len(values)
+
+    db.session.execute(delete(UsageSketch))
+    db.session.add_all(UsageSketch(energy_type=energy_type, period=key_period, shard=0,
+                                   reading_count=counts[(energy_type, key_period)], digest=digest.to_bytes())
+                       for (energy_type, key_period), digest in digests.items())
+    stats_cache.usage_changed()  # Cached fleet digests go stale on commit
+    return len(digests)
+
+
+def fleet_digest(energy_type, as_of=None):
+    # The fleet's readings over the last SKETCH_WINDOW_MONTHS calendar months, merged once and
+    # cached until the next write of this energy type (see stats_cache)
+    as_of = as_of or date.today()
+    months = current_app.config['SKETCH_WINDOW_MONTHS']
+    periods = [period(_months_back(as_of, offset)) for offset in range(months)]
+
+    def compute():
+        digest = TDigest()
+        for data, in db.session.query(UsageSketch.digest).filter(
+                UsageSketch.energy_type == energy_type, UsageSketch.period.in_(periods)):
+            digest.merge(TDigest.from_bytes(data))
+        return digest
+
+    return stats_cache.cached(f'sketch:{energy_type}:{periods[0]}', compute, tags={energy_type})
+
+
+def fleet_quantiles(energy_type, as_of=None):
+    digest = fleet_digest(energy_type, as_of)
+    if not digest.centroids:
+        return None
+    return {'p25': digest.quantile(0.25), 'p50': digest.quantile(0.5), 'p90': digest.quantile(0.9),
+            'readings': int(round(digest.count))}
+
+
+def user_comparison(user_id, energy_types, as_of=None):
+    # The user's average reading per energy type over the sketch window, placed within the fleet
+    as_of = as_of or date.today()
+    since = _months_back(as_of, current_app.config['SKETCH_WINDOW_MONTHS'] - 1)
+    averages = {energy_type: (total / count if count else None) for energy_type, total, count in db.session.query(
+        DailyUsage.energy_type, func.sum(DailyUsage.units_total), func.sum(DailyUsage.reading_count)
+    ).filter(
+        DailyUsage.user_id == user_id,
+        DailyUsage.energy_type.in_(energy_types),
+        DailyUsage.day >= since
+    ).group_by(DailyUsage.energy_type)}
+
+    comparison = []
+    for energy_type in energy_types:
+        average = averages.get(energy_type)
+        quantiles = fleet_quantiles(energy_type, as_of)
+        if average is None or quantiles is None:
+            continue
+        comparison.append(dict(quantiles, energy_type=energy_type, average=average,
+                               percentile=round(100 * fleet_digest(energy_type, as_of).cdf(average))))
+    return comparison
+
+
+@click.command('rebuild-sketches')
+def rebuild_sketches_command():
+    """Recompute the monthly fleet quantile sketches from the raw and archived readings."""
+    sketches = rebuild()
+    db.session.commit()
+    click.echo(f'{sketches} sketches rebuilt.')
@@ -0,0 +1,130 @@
+# stats_cache.py
+import threading
+import time
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from models import DailyUsage
+from __init__ import db
+
+_lock = threading.Lock()
+_cache = {}  # name -> (expires_at, value, tags); expires_at 0 marks a stale value kept while it is recomputed
+_computing = {}  # name -> (Event set when the running computation ends, its tags)
+_generations = {}  # name -> invalidation count, so a computation that raced a write is not stored as fresh
+
+
+def cached(name, compute, tags=None):
+    # Return the cached value for name, computing it at most once per TTL and in one thread at a time.
+    # tags are the energy types the value is computed from (None: all of them), see invalidate().
+    while True:
+        now = time.monotonic()
+        with _lock:
+            entry = _cache.get(name)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            running = _computing.get(name)
+            if running is None:
+                done = threading.Event()
+                _computing[name] = (done, tags)
+                generation = _generations.get(name, 0)
+                break
+            if entry is not None:
+                return entry[1]  # Another thread is refreshing it; serve the stale value meanwhile
+        running[0].wait()
+
+    try:
+        value = compute()
+        with _lock:
+            if _generations.get(name, 0) == generation:
+                _cache[name] = (now + current_app.config['STATS_CACHE_TTL'], value, tags)
+        return value
+    finally:
+        with _lock:
+            del _computing[name]
+        done.set()
+
+
+def invalidate(name=None, tags=None):
+    # Without arguments every value is dropped. With a name or tags the matching values (those computed
+    # from any of the tags, or from everything) are only marked stale: the next caller recomputes them
+    # while concurrent callers keep getting the old value.
+    with _lock:
+        if name is None and tags is None:
+            _cache.clear()
+            names = set(_computing)
+        else:
+            names = {key for key, (_, entry_tags) in _computing.items()
+                     if _matches(key, entry_tags, name, tags)}
+            for key, (_, value, entry_tags) in list(_cache.items()):
+                if _matches(key, entry_tags, name, tags):
+                    _cache[key] = (0, value, entry_tags)
+                    names.add(key)
+        for key in names:
+            _generations[key] = _generations.get(key, 0) + 1
+
+
+def _matches(key, entry_tags, name, tags):
+    if name is not None and key != name:
+        return False
+    return tags is None or entry_tags is None or not entry_tags.isdisjoint(tags)
+
+
+def usage_changed(energy_types=None):
+    # Called by write paths in the session's transaction: values computed from these energy types
+    # (None: all of them) go stale when it commits
+    info = db.session.info
+    if energy_types is None or info.get('usage_changed') is True:
+        info['usage_changed'] = True
+    else:
+        info.setdefault('usage_changed', set()).update(energy_types)
+
+
+def _compute_fleet_stats():
+    # Fleet-wide stats per energy type from the daily rollup:
+    # average/total/readings over all time, active users and a per-day trend for the recent window
+    trend_days = current_app.config['STATS_TREND_DAYS']
+    since = date.today() - timedelta(days=trend_days - 1)
+
+    stats = {}
+    for energy_type, total, readings in db.session.query(
+            DailyUsage.energy_type, func.sum(DailyUsage.units_total), func.sum(DailyUsage.reading_count)
+    ).group_by(DailyUsage.energy_type):
+        stats[energy_type] = {
+            'average': total / readings if readings else 0,
+            'total': total or 0,
+            'readings': readings or 0,
+            'active_users': 0,
+            'trend': [],
+        }
+
+    for energy_type, active_users in db.session.query(
+            DailyUsage.energy_type, func.count(func.distinct(DailyUsage.user_id))
+    ).filter(DailyUsage.day >= since).group_by(DailyUsage.energy_type):
+        stats[energy_type]['active_users'] = active_users
+
+    for energy_type, day, total in db.session.query(
+            DailyUsage.energy_type, DailyUsage.day, func.sum(DailyUsage.units_total)
+    ).filter(DailyUsage.day >= since).group_by(DailyUsage.energy_type, DailyUsage.day).order_by(DailyUsage.day):
+        stats[energy_type]['trend'].append((day, total))
+
+    return stats
+
+
+def fleet_stats():
+    return cached('fleet_stats', _compute_fleet_stats)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_usage_commit(session):
+    # Write paths flag the session when they touch usage data (see usage_changed)
+    changed = session.info.pop('usage_changed', None)
+    if changed is True:
+        invalidate()
+    elif changed:
+        invalidate(tags=changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_usage_flag(session):
+    session.info.pop('usage_changed', None)
@@ -0,0 +1,93 @@
+# storage.py
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Storage profiles: PRAGMAs run on every new SQLite connection, plus SQLAlchemy pool settings.
+# Pool settings also apply to other backends; PRAGMAs are SQLite only.
+PROFILES = {
+    # SQLite as shipped: rollback journal, FULL sync, no busy timeout
+    'default': {
+        'pragmas': {},
+        'pool': {},
+    },
+    # Concurrent readers alongside one writer; writers wait instead of failing with "database is locked"
+    'sqlite-wal': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',  # Durable at checkpoints; safe against corruption in WAL mode
+            'busy_timeout': 5000,  # Milliseconds
+            'cache_size': -65536,  # Negative means KiB: 64 MiB page cache per connection
+            'mmap_size': 268435456,  # 256 MiB memory-mapped I/O
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+    },
+    # WAL with fsync on every commit
+    'sqlite-wal-durable': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'busy_timeout': 10000,
+            'cache_size': -65536,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30},
+    },
+}
+
+
+def load_environment(app):
+    # DATABASE_URL switches backends, STORAGE_PROFILE picks a profile, DB_POOL_* tune the pool
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['STORAGE_PROFILE'] = os.environ.get('STORAGE_PROFILE', app.config['STORAGE_PROFILE'])
+    for name, key in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'), ('DB_POOL_TIMEOUT', 'pool_timeout')):
+        if name in os.environ:
+            app.config['STORAGE_POOL'][key] = int(os.environ[name])
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def configure(app):
+    # Called before db.init_app: fold the profile's pool settings into SQLALCHEMY_ENGINE_OPTIONS
+    profile_name = app.config['STORAGE_PROFILE']
+    if profile_name not in PROFILES:
+        raise ValueError(f"Unknown STORAGE_PROFILE {profile_name!r}; choose from {', '.join(PROFILES)}")
+    profile = PROFILES[profile_name]
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if not _is_sqlite_memory(url):  # In-memory SQLite uses a single shared connection
+        for key, value in dict(profile['pool'], **app.config['STORAGE_POOL']).items():
+            options.setdefault(key, value)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def install(app, db):
+    # Called after db.init_app: apply the profile's PRAGMAs to every new SQLite connection
+    pragmas = dict(PROFILES[app.config['STORAGE_PROFILE']]['pragmas'], **app.config['STORAGE_PRAGMAS'])
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def describe(engine):
+    # Effective settings of a live SQLite connection, for benchmarks and diagnostics
+    if engine.dialect.name != 'sqlite':
+        return {'backend': engine.dialect.name}
+    with engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')}
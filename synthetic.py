@@ -0,0 +1,108 @@
+# synthetic.py
+import time
+from datetime import date, timedelta
+import click
+from flask import current_app
+from sqlalchemy import func, insert
+from models import User, EnergyUsage
+from __init__ import db
+import recommender
+import rollup
+import passwords
+import lazy
+
+ENERGY_TYPES = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
+
+# Typical units per reading: kWh, litres, m³, litres
+BASE_UNITS = {'electricity': 12.0, 'water': 150.0, 'naturalgas': 3.0, 'vehiclefuel': 20.0}
+EMAIL_DOMAIN = 'synthetic.example.com'
+USERS_PER_COMMIT = 100
+
+
+def _readings(rng, user_id, energy_type, start_day, days, readings_per_day):
+    # Gamma-distributed readings around a per-user level, with a winter peak
+    np = lazy.numpy()
+    count = days * readings_per_day
+    offsets = np.sort(rng.integers(0, days * 86400, size=count))
+    day_of_year = (np.datetime64(start_day) + offsets.astype('timedelta64[s]')).astype('datetime64[D]')
+    day_of_year = (day_of_year - day_of_year.astype('datetime64[Y]')).astype(int)
+    season = 1 + 0.25 * np.cos(2 * np.pi * (day_of_year - 15) / 365)
+    level = BASE_UNITS.get(energy_type, 10.0) * rng.lognormal(0, 0.35) / readings_per_day
+    units = rng.gamma(4.0, level * season / 4.0)
+    timestamps = (np.datetime64(start_day, 's') + offsets.astype('timedelta64[s]')).astype('datetime64[us]').tolist()
+    return [{'user_id': user_id, 'meter_number': None, 'energy_type': energy_type,
+             'units_used': round(float(value), 3), 'date_recorded': recorded}
+            for value, recorded in zip(units, timestamps)]
+
+
+def generate(users=100, years=1.0, readings_per_day=1, energy_types=None, seed=0, admins=1,
+             password='password', recommendation_days=recommender.WINDOW_DAYS, end_day=None):
+    # Fill User, EnergyUsage (plus the daily rollup) and Recommendations with reproducible
+    # synthetic data: users × years × readings/day × energy types readings in total.
+    np = lazy.numpy()
+    started = time.perf_counter()
+    energy_types = energy_types or ENERGY_TYPES
+    end_day = end_day or date.today()
+    days = max(int(round(years * 365)), 1)
+    start_day = end_day - timedelta(days=days - 1)
+    rng = np.random.default_rng(seed)
+
+    if db.session.query(User.id).filter(User.email.like(f'%@{EMAIL_DOMAIN}')).first() is not None:
+        raise ValueError(f'Synthetic users already exist (@{EMAIL_DOMAIN}); use a fresh database')
+
+    password_hash = passwords.hash_password(password)  # One hash shared by every synthetic account
+    last_id = db.session.query(func.max(User.id)).scalar() or 0
+    accounts = [{'firstname': 'Admin', 'lastname': str(i), 'email': f'admin{i}@{EMAIL_DOMAIN}',
+                 'password_hash': password_hash, 'is_admin': True} for i in range(admins)]
+    accounts += [{'firstname': 'User', 'lastname': str(i), 'email': f'user{i}@{EMAIL_DOMAIN}',
+                  'password_hash': password_hash, 'is_admin': False,
+                  'electricity_meter_number': f'SE{seed}-{i:07d}', 'water_meter_number': f'SW{seed}-{i:07d}'}
+                 for i in range(users)]
+    db.session.execute(insert(User), accounts)
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(
+        User.id > last_id, User.is_admin.is_(False)).order_by(User.id)]
+    db.session.commit()
+
+    batch_size = current_app.config['INGEST_BATCH_SIZE']
+    readings = 0
+    for first in range(0, len(user_ids), USERS_PER_COMMIT):
+        batch = []
+        for user_id in user_ids[first:first + USERS_PER_COMMIT]:
+            for energy_type in energy_types:
+                batch.extend(_readings(rng, user_id, energy_type, start_day, days, readings_per_day))
+        for offset in range(0, len(batch), batch_size):
+            values = batch[offset:offset + batch_size]
+            db.session.execute(insert(EnergyUsage), values)
+            rollup.add_readings((row['user_id'], row['energy_type'], row['date_recorded'], row['units_used'])
+                                for row in values)
+        db.session.commit()
+        readings += len(batch)
+
+    recommendations = sum(recommender.generate(end_day - timedelta(days=offset))
+                          for offset in range(recommendation_days))
+
+    seconds = time.perf_counter() - started
+    return {'users': len(user_ids), 'admins': admins, 'readings': readings, 'recommendations': recommendations,
+            'first_day': start_day.isoformat(), 'last_day': end_day.isoformat(), 'seconds': round(seconds, 3)}
+
+
+@click.command('seed-data')
+@click.option('--users', type=int, default=100, show_default=True)
+@click.option('--years', type=float, default=1.0, show_default=True)
+@click.option('--readings-per-day', type=int, default=1, show_default=True, help='Per user and energy type.')
+@click.option('--energy-type', 'energy_types', type=click.Choice(ENERGY_TYPES), multiple=True,
+              help='Energy types to generate (repeatable; default: all).')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--admins', type=int, default=1, show_default=True)
+@click.option('--password', default='password', show_default=True, help='Password for every synthetic account.')
+@click.option('--recommendation-days', type=int, default=recommender.WINDOW_DAYS, show_default=True)
+def seed_data_command(users, years, readings_per_day, energy_types, seed, admins, password, recommendation_days):
+    """Fill the database with reproducible synthetic users, readings and recommendations."""
+    try:
+        result = generate(users, years, readings_per_day, list(energy_types) or None, seed, admins,
+                          password, recommendation_days)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{result['users']} users, {result['admins']} admins, {result['readings']} readings "
+               f"({result['first_day']} to {result['last_day']}), {result['recommendations']} recommendations "
+               f"in {result['seconds']}s")
@@ -0,0 +1,31 @@
+# tests/test_query_plans.py
+#
+# Every route's usage queries must be served from an index: none may plan a full scan of
+# energy_usage or the other per-user tables, on a database built by the shipped migrations.
+#
+#   python -m pytest -q tests
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_plans
+
+
+@pytest.fixture(scope='module')
+def plans():
+    results = {}
+    for route, statement, plan, ok in query_plans.check_query_plans():
+        results.setdefault(route, []).append((statement, plan, ok))
+    return results
+
+
+@pytest.mark.parametrize('route', query_plans.USER_ROUTES + query_plans.ADMIN_ROUTES)
+def test_route_uses_an_index(plans, route):
+    queries = plans.get(route)
+    assert queries and queries[0][0] is not None, f'{route} issued no usage query'
+    for statement, plan, ok in queries:
+        assert not any(detail.startswith('SCAN energy_usage') for detail in plan), f'{statement}\n{plan}'
+        assert ok, f'full scan of a usage table:\n{statement}\n{plan}'
@@ -0,0 +1,110 @@
+# user_cache.py
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import User
+from __init__ import db
+
+SNAPSHOT_FIELDS = ('id', 'firstname', 'lastname', 'email', 'is_admin', 'electricity_meter_number', 'water_meter_number')
+
+
+class CachedUser(UserMixin):
+    # Read-only copy of a User row for current_user. Load the real User
+    # (db.session.get(User, current_user.id)) before changing anything.
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            setattr(self, field, getattr(user, field))
+
+    def __repr__(self):
+        return f'<CachedUser {self.id} {self.email}>'
+
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user_id -> (expires_at, CachedUser), least recently used first
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_generations = {}  # user_id -> invalidation count, so a load racing an invalidation is not cached
+
+
+def load(user_id):
+    # Flask-Login user_loader: serve a snapshot from the cache, falling back to the database
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            _entries.move_to_end(user_id)
+            _counters['hits'] += 1
+            return entry[1]
+        _counters['misses'] += 1
+
+    with _lock:
+        generation = _generations.get(user_id, 0)
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    snapshot = CachedUser(user)
+
+    max_size = current_app.config['USER_CACHE_SIZE']
+    with _lock:
+        if _generations.get(user_id, 0) != generation:
+            return snapshot  # Invalidated while we were reading; the row we read may be the old one
+        _entries[user_id] = (now + current_app.config['USER_CACHE_TTL'], snapshot)
+        _entries.move_to_end(user_id)
+        while len(_entries) > max_size:
+            _entries.popitem(last=False)
+            _counters['evictions'] += 1
+    return snapshot
+
+
+def invalidate(user_id=None):
+    with _lock:
+        if user_id is None:
+            _entries.clear()
+            for cached_id in _generations:
+                _generations[cached_id] += 1
+        else:
+            _entries.pop(user_id, None)
+            _generations[user_id] = _generations.get(user_id, 0) + 1
+        _counters['invalidations'] += 1
+
+
+def confirm_admin(user):
+    # Admin rights are checked against the database: another worker may have revoked them while
+    # this process still serves the old snapshot. A stale snapshot is dropped on the way.
+    if not user.is_authenticated or not user.is_admin:
+        return False
+    is_admin = db.session.query(User.is_admin).filter(User.id == user.id).scalar()
+    if not is_admin:
+        invalidate(user.id)
+    return bool(is_admin)
+
+
+def stats():
+    with _lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return dict(_counters, size=len(_entries),
+                    hit_ratio=round(_counters['hits'] / lookups, 4) if lookups else None)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _record_changed_user(mapper, connection, target):
+    # Flushed changes to a user (email, is_admin, ...) are remembered until the transaction ends
+    if target.id is not None:
+        object_session(target).info.setdefault('changed_users', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    # Dropped only once committed, so a concurrent load cannot re-cache the old row after the drop
+    for user_id in session.info.pop('changed_users', ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_users', None)
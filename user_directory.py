@@ -0,0 +1,79 @@
+# user_directory.py
+from sqlalchemy import func, case, select, or_
+from models import User, DailyUsage
+from __init__ import db
+
+ENERGY_TYPES = ['electricity', 'water', 'naturalgas', 'vehiclefuel']
+
+
+def _summary_columns():
+    # Per-user aggregates over the daily rollup; every column is labelled so it can be sorted on
+    columns = [
+        func.max(DailyUsage.day).label('last_reading'),
+        func.coalesce(func.sum(DailyUsage.reading_count), 0).label('readings'),
+    ]
+    for energy_type in ENERGY_TYPES:
+        total = func.sum(case((DailyUsage.energy_type == energy_type, DailyUsage.units_total), else_=0))
+        count = func.sum(case((DailyUsage.energy_type == energy_type, DailyUsage.reading_count), else_=0))
+        columns.append(func.coalesce(total, 0).label(f'total_{energy_type}'))
+        columns.append((total / func.nullif(count, 0)).label(f'average_{energy_type}'))
+    return columns
+
+
+SORT_KEYS = ['name', 'email', 'last_reading', 'readings'] + \
+    [f'{kind}_{energy_type}' for energy_type in ENERGY_TYPES for kind in ('total', 'average')]
+
+
+def _nocase(column):
+    # Directory searches and sorts ignore (ASCII) case, matching the NOCASE indexes on User
+    return column.collate('NOCASE')
+
+
+def _prefix(column, search):
+    # Case-insensitive prefix match as a range, so it can be answered from a NOCASE index on column
+    # (unlike LIKE, whose % and _ wildcards would need escaping)
+    column = _nocase(column)
+    return (column >= search) & (column < search + '\uffff')
+
+
+def _search_filter(search):
+    # Email prefix via its NOCASE index; without an '@' also first/last name prefixes, each with its own index
+    if '@' in search:
+        return _prefix(User.email, search)
+    return or_(_prefix(User.email, search), _prefix(User.lastname, search), _prefix(User.firstname, search))
+
+
+def directory_page(page=1, per_page=50, search=None, sort='name', descending=False):
+    # One page of users with their usage summaries.
+    # Returns (rows, total_users); each row is (User, last_reading, readings, total_*/average_* ...).
+    summary = _summary_columns()
+    count_query = select(func.count(User.id))
+    if search:
+        count_query = count_query.where(_search_filter(search))
+    total_users = db.session.execute(count_query).scalar()
+
+    def ordered(columns):
+        return [column.desc() if descending else column.asc() for column in columns] + [User.id]
+
+    if sort in ('name', 'email'):
+        # Pick the page from the user table alone, then summarize only those users' rollup rows
+        page_ids = select(User.id)
+        if search:
+            page_ids = page_ids.where(_search_filter(search))
+        columns = [_nocase(User.lastname), _nocase(User.firstname)] if sort == 'name' else [_nocase(User.email)]
+        page_ids = [user_id for user_id, in db.session.execute(
+            page_ids.order_by(*ordered(columns)).limit(per_page).offset((page - 1) * per_page))]
+        if not page_ids:
+            return [], total_users
+        rows = db.session.execute(select(User, *summary).outerjoin(DailyUsage, DailyUsage.user_id == User.id).where(
+            User.id.in_(page_ids)).group_by(User.id)).all()
+        position = {user_id: index for index, user_id in enumerate(page_ids)}
+        return sorted(rows, key=lambda row: position[row[0].id]), total_users
+
+    # Sorting on a summary column has to aggregate every matching user before the LIMIT
+    query = select(User, *summary).outerjoin(DailyUsage, DailyUsage.user_id == User.id).group_by(User.id)
+    if search:
+        query = query.where(_search_filter(search))
+    order = ordered([next(column for column in summary if column.name == sort)])
+    rows = db.session.execute(query.order_by(*order).limit(per_page).offset((page - 1) * per_page)).all()
+    return rows, total_users
@@ -0,0 +1,53 @@
+# vendor.py
+import base64
+import hashlib
+import io
+import json
+import os
+import tarfile
+import urllib.request
+import click
+from flask import current_app
+
+# Chart.js is served from static/ rather than a CDN, so the authenticated pages that draw charts
+# only run script from this origin. `flask vendor-chartjs` fetches the pinned release.
+CHARTJS_VERSION = '4.4.1'
+CHARTJS_FILE = 'vendor/chart.umd.js'  # Relative to the static folder
+REGISTRY = 'https://registry.npmjs.org/chart.js'
+
+
+def chartjs_path(app=None):
+    return os.path.join((app or current_app).static_folder, CHARTJS_FILE)
+
+
+def check(app):
+    # The charts stay blank without the file; say so at start-up rather than as a 404 in the browser
+    if not os.path.exists(chartjs_path(app)):
+        app.logger.warning('static/%s is missing; run `flask vendor-chartjs` to fetch Chart.js %s',
+                           CHARTJS_FILE, CHARTJS_VERSION)
+
+
+@click.command('vendor-chartjs')
+def vendor_chartjs_command():
+    """Download the pinned Chart.js release into static/vendor, verified against the npm registry."""
+    try:
+        with urllib.request.urlopen(f'{REGISTRY}/{CHARTJS_VERSION}', timeout=30) as response:
+            dist = json.load(response)['dist']
+        with urllib.request.urlopen(dist['tarball'], timeout=60) as response:
+            tarball = response.read()
+    except OSError as e:
+        raise click.ClickException(f'could not download Chart.js {CHARTJS_VERSION}: {e}')
+
+    # The registry's integrity is a base64 digest of the tarball, e.g. 'sha512-...'
+    algorithm, expected = dist['integrity'].split('-', 1)
+    if base64.b64encode(hashlib.new(algorithm, tarball).digest()).decode() != expected:
+        raise click.ClickException(f'chart.js-{CHARTJS_VERSION}.tgz does not match the registry integrity')
+    with tarfile.open(fileobj=io.BytesIO(tarball)) as package:
+        script = package.extractfile('package/dist/chart.umd.js').read()
+
+    path = chartjs_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(script)
+    digest = base64.b64encode(hashlib.sha384(script).digest()).decode()
+    click.echo(f'Wrote {path} (Chart.js {CHARTJS_VERSION}, sha384-{digest}).')
@@ -0,0 +1,174 @@
+# write_behind.py
+import atexit
+import queue
+import threading
+import time
+from flask import current_app
+from sqlalchemy import insert
+from models import EnergyUsage
+from __init__ import db
+import metrics
+import rollup
+
+_STOP = object()
+
+
+class WriteBehind:
+    # Readings accepted by data_entry wait here and are group-committed by one writer thread:
+    # a batch closes after WRITE_BEHIND_MAX_BATCH readings or WRITE_BEHIND_MAX_DELAY seconds.
+    # Pending counts are per process, so read-your-writes holds within one worker.
+
+    def __init__(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['WRITE_BEHIND_QUEUE_SIZE'])
+        self.max_batch = app.config['WRITE_BEHIND_MAX_BATCH']
+        self.max_delay = app.config['WRITE_BEHIND_MAX_DELAY']
+        self._pending = {}  # user_id -> readings queued or being written
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, reading):
+        # reading: dict of EnergyUsage columns. Raises queue.Full if the writer cannot keep up.
+        self._ensure_started()
+        user_id = reading['user_id']
+        with self._condition:
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        try:
+            self.queue.put(reading, timeout=self.app.config['WRITE_BEHIND_SUBMIT_TIMEOUT'])
+        except queue.Full:
+            self._done([reading])
+            raise
+
+    def wait_for_user(self, user_id, timeout):
+        # Block until the user's queued readings are committed; False if the timeout expired
+        with self._condition:
+            return self._condition.wait_for(lambda: user_id not in self._pending, timeout)
+
+    def close(self, timeout=None):
+        # Flush everything still queued, then stop the writer. Gives up after the timeout so process exit
+        # cannot hang on a stuck database, logging every reading that was not written.
+        if self._closed or self._thread is None or not self._thread.is_alive():
+            return
+        self._closed = True
+        timeout = self.app.config['WRITE_BEHIND_SHUTDOWN_TIMEOUT'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass  # The writer is not draining the queue; what it has not taken is logged below
+        self._thread.join(max(deadline - time.monotonic(), 0))
+        if self._thread.is_alive():
+            self._drop_queued(timeout)
+
+    def _drop_queued(self, timeout):
+        dropped = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                dropped.append(item)
+        with self._condition:
+            in_flight = sum(self._pending.values()) - len(dropped)
+        self.app.logger.error('Write-behind writer did not finish within %.1fs: dropping %d queued readings '
+                              '(%d more in a batch still being written)', timeout, len(dropped), in_flight)
+        for reading in dropped:
+            self.app.logger.error('Dropped reading: %r', reading)
+        self._done(dropped)
+
+    def _done(self, batch):
+        with self._condition:
+            for reading in batch:
+                user_id = reading['user_id']
+                self._pending[user_id] -= 1
+                if not self._pending[user_id]:
+                    del self._pending[user_id]
+            self._condition.notify_all()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+        # Flush-on-shutdown: anything submitted before close() is still written
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for first in range(0, len(batch), self.max_batch):
+            self._write(batch[first:first + self.max_batch])
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(EnergyUsage), batch)
+                rollup.add_readings((row['user_id'], row['energy_type'], row['date_recorded'], row['units_used'])
+                                    for row in batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Write-behind batch of %d readings failed; retrying one by one', len(batch))
+                for reading in batch:
+                    try:
+                        db.session.execute(insert(EnergyUsage), [reading])
+                        rollup.add_readings([(reading['user_id'], reading['energy_type'],
+                                              reading['date_recorded'], reading['units_used'])])
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Write-behind dropped reading %r', reading)
+        metrics.observe('write_behind_batch_size', len(batch))
+        metrics.observe('write_behind_commit_seconds', time.perf_counter() - started)
+        self._done(batch)
+
+
+def install(app):
+    if not app.config['WRITE_BEHIND_ENABLED']:
+        return
+    writer = app.extensions['write_behind'] = WriteBehind(app)
+    metrics.gauge('write_behind_queue_depth', writer.queue.qsize)
+
+
+def enabled():
+    return 'write_behind' in current_app.extensions
+
+
+def submit(reading):
+    current_app.extensions['write_behind'].submit(reading)
+
+
+def wait_for_user(user_id):
+    # Read-your-writes: called before pages that show the user's own readings
+    writer = current_app.extensions.get('write_behind')
+    if writer is not None:
+        writer.wait_for_user(user_id, current_app.config['WRITE_BEHIND_READ_TIMEOUT'])